@@ -1,50 +1,140 @@
-from flask import Flask, request, render_template
+from flask import Flask, Response, g, request, render_template
 import logging
 import json
+import os
+import gzip
 import subprocess
+import time
 import re
 from parser import Parser, Node
 from ssa_converter import SSAConverter
-from smt_generator import SMTGenerator
+from smt_generator import SMTGenerator, model_value
+from portfolio import SolverPortfolio
+from cubes import CubeSolver
+from scheduler import SolverScheduler, query_features
+from incremental import IncrementalPipeline
+from artifacts import ArtifactStore, Artifact
+from kinduction import KInductionEngine
+from profiling import RequestProfiler, StageTimer, profiling_requested
+from intervals import IntervalAnalysis, loop_depths
+from governance import RequestBudget, RequestGuard, JobRegistry, Cancelled, communicate_guarded
 
 app = Flask(__name__)
 
+# Any executable that speaks the z3 command line, e.g. a local z3 or stub_solver.py for load tests
+Z3_PATH = os.environ.get("FM_Z3_PATH", "C:\\z3-4.15.0-x64-win\\bin\\z3.exe")
+
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def run_z3(smt_code):
-    try:
-        with open("output.smt2", "w") as f:
-            f.write(smt_code)
-        result = subprocess.run(["C:\\z3-4.15.0-x64-win\\bin\\z3.exe", "output.smt2"], capture_output=True, text=True, timeout=10)
-        output = result.stdout.strip()
-        
-        model = []
-        status = "unknown"
-        
-        for line in output.split('\n'):
-            line = line.strip()
-            if line == "sat":
-                status = "sat"
-            elif line == "unsat":
-                status = "unsat"
-            elif line.startswith("(define-fun"):
-                match = re.match(r'\(define-fun (\w+) \(\) (Int|Bool) (.+)\)', line)
-                if match:
-                    var, _, value = match.groups()
-                    if value in ("true", "false"):
-                        value = value.capitalize()
-                    model.append(f"{var} = {value}")
-            elif not line.startswith("(error"):
-                model.append(line)
-        
-        if status == "sat" and not model:
+solver_portfolio = SolverPortfolio(Z3_PATH)
+cube_solver = CubeSolver(Z3_PATH, max_workers=int(os.environ.get("FM_CUBE_WORKERS", 0)) or None)
+request_budget = RequestBudget.from_env()
+job_registry = JobRegistry()
+pipeline = IncrementalPipeline()
+solve_scheduler = SolverScheduler.from_env()
+artifact_store = ArtifactStore(ttl=int(os.environ.get("FM_RESULT_TTL", 900)))
+
+# "auto" turns small arrays of known length and in-bounds indices into scalars, "theory" always uses SMT arrays
+ARRAY_ENCODING = os.environ.get("FM_ARRAY_ENCODING", "auto")
+# "minimal" places phis only where differing definitions meet and are still read, "structured" after every if
+PHI_PLACEMENT = os.environ.get("FM_PHI_PLACEMENT", "minimal")
+
+ARTIFACT_TYPES = {"ast": "application/json", "unrolled": "text/plain; charset=utf-8",
+                  "ssa": "text/plain; charset=utf-8", "smt": "text/plain; charset=utf-8"}
+
+def parse_z3_output(output):
+    """Turn raw Z3 output into a (status, model lines) pair for the Counterexamples tab."""
+    output = output.strip()
+    model = []
+    # No answer at all means Z3 failed (bad script, killed by the memory limit, ...)
+    status = "error"
+
+    for line in output.split('\n'):
+        line = line.strip()
+        if line in ("sat", "unsat"):
+            status = line
+        elif line == "unknown" and status == "error":
+            status = "unknown"
+
+    # Z3 may spread a definition over several lines; array models are not shown
+    for var, value in re.findall(r'\(define-fun (\w+) \(\) (?:Int|Bool)\s+(\(- \d+\)|[^\s()]+)\)', output):
+        value = value.capitalize() if value in ("true", "false") else model_value(value)
+        model.append(f"{var} = {value}")
+
+    if status == "sat":
+        if not model:
             model = ["No model available due to errors."]
-        elif status == "unsat":
-            model = ["No counterexamples found (program is correct)."]
-        elif status == "unknown":
-            model = [output if output else "Verification inconclusive due to errors."]
-        
-        return status, model
+    elif status == "unsat":
+        model = ["No counterexamples found (program is correct)."]
+    else:
+        model = [output if output else "Verification inconclusive due to errors."]
+
+    return status, model
+
+def split_variants(code):
+    """Split the variants textarea on separator lines such as '===' or '=== Variant 2 ==='."""
+    variants = re.split(r'^\s*===.*$', code, flags=re.MULTILINE)
+    return [variant.strip() for variant in variants if variant.strip()]
+
+def parse_variant_output(output, variant_checks):
+    """
+    Split the answers of a multi-variant script (one check-sat-assuming plus
+    get-value per variant) into one table row per variant.
+    """
+    answers = []
+    for line in output.split('\n'):
+        line = line.strip()
+        if line in ("sat", "unsat", "unknown"):
+            answers.append((line, []))
+        elif answers and not line.startswith("(error"):
+            answers[-1][1].append(line)
+    if not answers:
+        return "error", [output.strip() or "Verification inconclusive due to errors."]
+
+    rows = []
+    for i, check in enumerate(variant_checks):
+        row = {"name": check["name"], "status": "unknown", "verdict": "Inconclusive", "details": []}
+        if i < len(answers):
+            status, lines = answers[i]
+            row["status"] = status
+            if status == "unsat":
+                row["verdict"] = "Equivalent"
+            elif status == "sat":
+                row["verdict"] = "Counterexample"
+                values = {term: model_value(value) for term, value in re.findall(r'\((\w+) (\(- \d+\)|[^\s()]+)\)', " ".join(lines))}
+                for term in check["inputs"]:
+                    row["details"].append(f"input {term.rsplit('_0_', 1)[0]} = {values.get(term, '?')}")
+                for var, ref, cand in check["pairs"]:
+                    ref_value, cand_value = values.get(ref, "?"), values.get(cand, "?")
+                    marker = "  <-- differs" if ref_value != cand_value else ""
+                    row["details"].append(f"{var}: reference = {ref_value}, variant = {cand_value}{marker}")
+        rows.append(row)
+
+    statuses = [row["status"] for row in rows]
+    if "sat" in statuses:
+        overall = "sat"
+    elif statuses and all(status == "unsat" for status in statuses):
+        overall = "unsat"
+    else:
+        overall = "unknown"
+    return overall, rows
+
+def z3_output(smt_code, guard=None):
+    """Run Z3 on a script within the request's budget and return its raw output."""
+    guard = guard or RequestGuard(request_budget)
+    budget = guard.budget
+    timeout = max(1, min(budget.solver_timeout, int(guard.remaining())))
+    process = subprocess.Popen([Z3_PATH, "-in", f"-T:{timeout}", f"-memory:{budget.solver_memory_mb}"],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               text=True)
+    budget.limit_solver(process)
+    return communicate_guarded(process, smt_code, guard, timeout=timeout + 5)
+
+def run_z3(smt_code, guard=None, parse=parse_z3_output):
+    try:
+        return parse(z3_output(smt_code, guard))
+    except Cancelled:
+        raise
     except subprocess.TimeoutExpired:
         return "error", ["Z3 timed out"]
     except FileNotFoundError:
@@ -52,8 +142,78 @@ def run_z3(smt_code):
     except Exception as e:
         return "error", [f"Z3 error: {str(e)}"]
 
-def generate_unrolled_code(ast, unroll_depth):
+def run_z3_portfolio(smt_code, guard=None, max_workers=None):
+    """Race the portfolio configurations on the query; returns (status, model, winning config)."""
+    try:
+        output, winner, elapsed = solver_portfolio.solve(smt_code, guard, max_workers)
+        if winner is None and not output:
+            return "error", ["Z3 timed out"], None
+        logging.debug(f"Portfolio winner: {winner} after {elapsed:.3f}s")
+        status, model = parse_z3_output(output)
+        return status, model, winner
+    except Cancelled:
+        raise
+    except FileNotFoundError:
+        return "error", ["Z3 not found. Please ensure Z3 is installed or specify its path in app.py."], None
+    except Exception as e:
+        return "error", [f"Z3 error: {str(e)}"], None
+
+def run_z3_cubes(smt_code, guard=None, max_workers=None):
+    """Solve the query by cube-and-conquer; returns (status, model, summary line for the Counterexamples tab)."""
+    try:
+        output, summary = cube_solver.solve(smt_code, guard, max_workers)
+        logging.debug(f"Cube-and-conquer: {summary}")
+        status, model = parse_z3_output(output)
+        split = ", ".join(summary["variables"]) or "no branch conditions"
+        cubes = f"{summary['cubes']} cube" + ("s" if summary["cubes"] != 1 else "")
+        line = f"{cubes} on {split}, {summary['refuted']} refuted in {summary['elapsed']:.2f}s"
+        return status, model, line
+    except Cancelled:
+        raise
+    except FileNotFoundError:
+        return "error", ["Z3 not found. Please ensure Z3 is installed or specify its path in app.py."], ""
+    except Exception as e:
+        return "error", [f"Z3 error: {str(e)}"], ""
+
+def run_kinduction(ast, max_k, invariants, guard, result):
+    """Prove Program 1 by k-induction (k up to max_k) and fill in the result tabs."""
+    engine = KInductionEngine(lambda smt_code: z3_output(smt_code, guard), max_k=max_k, invariants=invariants)
+    try:
+        outcome = engine.prove(ast)
+    except Cancelled:
+        raise
+    except subprocess.TimeoutExpired:
+        outcome = {"status": "error", "details": ["Z3 timed out"]}
+    except FileNotFoundError:
+        outcome = {"status": "error", "details": ["Z3 not found. Please ensure Z3 is installed or specify its path in app.py."]}
+    if engine.program:
+        result["ssa"] = engine.program.ssa_listing()
+    result["unrolled"] = generate_unrolled_code(ast, outcome.get("k", 1))
+    result["smt_result"] = engine.last_script
+    result["counterexamples"] = outcome["details"]
+    result["status"] = outcome["status"]
+
+def plan_unrolling(ast, depth, automatic=False):
+    """
+    Per-loop unroll depths from the interval analysis (see intervals.py), and
+    one comment line per loop describing its bound for the Parse tab.
+    """
+    analysis = IntervalAnalysis()
+    try:
+        analysis.analyze(ast)
+    except ValueError as e:
+        logging.debug(f"Interval analysis skipped: {str(e)}")
+        return {}, ""
+    depths = loop_depths(analysis, depth, automatic)
+    return depths, "".join(f"// {line}\n" for line in analysis.describe(depths))
+
+def effective_depth(depths, depth):
+    """The deepest unrolling of any loop in a program, given its per-loop depths."""
+    return max(depths.values()) if depths else depth
+
+def generate_unrolled_code(ast, unroll_depth, loop_depths=None):
     """Generate unrolled code from AST for display in the Parse tab."""
+    loop_depths = loop_depths or {}
     def unroll_block(block, depth, indent=0):
         code = []
         for stmt in block.statements:
@@ -72,14 +232,14 @@ def generate_unrolled_code(ast, unroll_depth):
                     code.extend(unroll_block(stmt.false_branch, depth, indent + 1))
                     code.append("  " * indent + "}")
             elif stmt.type == "While" and depth > 0:
-                for i in range(depth):
+                for i in range(loop_depths.get(id(stmt), depth)):
                     code.append("  " * indent + f"if ({stmt.condition}) {{")
                     code.extend(unroll_block(stmt.body, depth, indent + 1))
                     code.append("  " * indent + "}")
             elif stmt.type == "For" and depth > 0:
                 init = stmt.init
                 code.append("  " * indent + f"{init};")
-                for i in range(depth):
+                for i in range(loop_depths.get(id(stmt), depth)):
                     code.append("  " * indent + f"if ({stmt.condition}) {{")
                     code.extend(unroll_block(stmt.body, depth, indent + 1))
                     code.append("  " * indent + f"  {stmt.update};")
@@ -91,88 +251,274 @@ def generate_unrolled_code(ast, unroll_depth):
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
-    result = {"parsed": "", "ssa": "", "smt_result": "", "counterexamples": [], "error": "", "dot_file": "", "status": "", "unrolled": ""}
+    result = {"parsed": "", "ssa": "", "smt_result": "", "counterexamples": [], "error": "", "dot_file": "", "status": "", "unrolled": "", "solver_config": "", "variants": [], "result_id": "", "profile": [], "cube_summary": ""}
     code1 = ""
     code2 = ""
     depth = 3
     mode = "verify"
+    portfolio = False
+    cubes = False
+    invariants = True
+    auto_depth = False
+    timer = g.stage_timer = StageTimer()
 
     if request.method == 'POST':
         code1 = request.form['code1'].strip()
         code2 = request.form.get('code2', '').strip()
+        portfolio = request.form.get('portfolio') == "on"
+        cubes = request.form.get('cubes') == "on"
+        invariants = request.form.get('invariants') == "on"
+        auto_depth = request.form.get('auto_depth') == "on"
         try:
             depth = int(request.form['depth'])
             if depth < 1:
                 raise ValueError("Unroll depth must be at least 1")
         except ValueError as e:
             result["error"] = f"Invalid unroll depth: {str(e)}"
-            return render_template('index.html', result=result, code1=code1, code2=code2, depth=depth, mode=mode)
+            return render_template('index.html', result=result, code1=code1, code2=code2, depth=depth, mode=mode, portfolio=portfolio, cubes=cubes, invariants=invariants, auto_depth=auto_depth)
 
         mode = request.form['mode']
-        parser = Parser()
+        guard = job_registry.register(RequestGuard(request_budget, request.form.get('job_id') or None))
+        profiler = RequestProfiler() if profiling_requested(request) else None
+        if profiler and not profiler.start():
+            profiler = None
+        if profiler:
+            # Listed up front: the k-induction branch renders before the finally block stores the files
+            result["profile"] = profiler.downloads()
 
         try:
             if not code1:
                 raise ValueError("Program 1 is required")
             if mode == "equivalence" and not code2:
                 raise ValueError("Second program required for equivalence mode")
+            if mode == "multi" and not split_variants(code2):
+                raise ValueError("At least one variant is required for multi-variant equivalence mode")
 
             logging.debug(f"Processing input: mode={mode}, depth={depth}")
             logging.debug(f"Code1:\n{code1}")
             if code2:
                 logging.debug(f"Code2:\n{code2}")
 
-            parse_result1 = parser.parse_program(code1)
+            with timer.stage("parse"):
+                parse_result1 = pipeline.parse_program(code1, guard)
             if isinstance(parse_result1, str):
                 raise ValueError(parse_result1)
             ast1_dict, dot_file1, ast1_node = parse_result1
-            result["parsed"] = json.dumps(ast1_dict, indent=2)
+            asts = {"Program 1": ast1_dict}
             result["dot_file"] = dot_file1
 
-            # Generate unrolled code for Program 1
-            result["unrolled"] = generate_unrolled_code(ast1_node, depth)
+            if mode == "kinduction":
+                # The loop is encoded once per induction frame, so depth bounds k instead of the unrolling
+                with timer.stage("solve"):
+                    run_kinduction(ast1_node, depth, invariants, guard, result)
+                result["parsed"] = json.dumps(asts, separators=(",", ":"))
+                with timer.stage("store"):
+                    result["result_id"] = store_artifacts(result)
+                return render_template('index.html', result=result, code1=code1, code2=code2, depth=depth, mode=mode, portfolio=portfolio, cubes=cubes, invariants=invariants, auto_depth=auto_depth)
+
+            with timer.stage("unroll"):
+                depths1, bounds1 = plan_unrolling(ast1_node, depth, auto_depth)
+                request_budget.check_unroll(ast1_node, depth, "Program 1", depths1)
 
-            ssa_converter = SSAConverter()
-            ssa_instructions1 = ssa_converter.convert(ast1_node, unroll_depth=depth)
+                # Generate unrolled code for Program 1
+                result["unrolled"] = bounds1 + generate_unrolled_code(ast1_node, depth, depths1)
+
+            with timer.stage("ssa"):
+                # Comparisons read every final value, a verification query only its assertions and the sortedness check
+                live_out = None if mode in ("equivalence", "multi") else SMTGenerator.verification_outputs()
+                ssa_instructions1 = pipeline.convert(ast1_node, unroll_depth=depth, guard=guard, loop_depths=depths1,
+                                                     live_out=live_out, phi_placement=PHI_PLACEMENT)
             result["ssa"] = "\n".join(str(instr) for instr in ssa_instructions1)
+            # Size of everything handed to the solver, for the scheduler's cost estimate
+            solved_ssa = list(ssa_instructions1)
+            solved_depth = effective_depth(depths1, depth)
 
-            smt_generator = SMTGenerator()
+            smt_generator = pipeline.smt_generator(array_encoding=ARRAY_ENCODING)
             smt_output = None
-            z3_result = None
 
             # Process Program 2 for equivalence mode
             if mode == "equivalence":
-                parser2 = Parser()
-                parse_result2 = parser2.parse_program(code2)
+                with timer.stage("parse"):
+                    parse_result2 = pipeline.parse_program(code2, guard)
                 if isinstance(parse_result2, str):
                     raise ValueError(parse_result2)
                 ast2_dict, dot_file2, ast2_node = parse_result2
-                result["parsed"] += "\n\n=== Program 2 AST ===\n" + json.dumps(ast2_dict, indent=2)
+                asts["Program 2"] = ast2_dict
                 result["dot_file"] = dot_file1
+                with timer.stage("unroll"):
+                    depths2, bounds2 = plan_unrolling(ast2_node, depth, auto_depth)
+                    request_budget.check_unroll(ast2_node, depth, "Program 2", depths2)
 
-                # Generate unrolled code for Program 2
-                result["unrolled"] += "\n\n=== Program 2 Unrolled ===\n" + generate_unrolled_code(ast2_node, depth)
+                    # Generate unrolled code for Program 2
+                    result["unrolled"] += "\n\n=== Program 2 Unrolled ===\n" + bounds2 + generate_unrolled_code(ast2_node, depth, depths2)
 
-                ssa_converter2 = SSAConverter()
-                ssa_instructions2 = ssa_converter2.convert(ast2_node, unroll_depth=depth)
+                with timer.stage("ssa"):
+                    ssa_instructions2 = pipeline.convert(ast2_node, unroll_depth=depth, guard=guard, loop_depths=depths2,
+                                                         phi_placement=PHI_PLACEMENT)
                 result["ssa"] += "\n\n=== Program 2 SSA ===\n" + "\n".join(str(instr) for instr in ssa_instructions2)
+                solved_ssa += ssa_instructions2
+                solved_depth = max(solved_depth, effective_depth(depths2, depth))
 
-                smt_output = smt_generator.generate_smt(ssa_instructions1, mode="comparison", ssa_instructions2=ssa_instructions2)
+                with timer.stage("smt"):
+                    smt_output = smt_generator.generate_smt(ssa_instructions1, mode="comparison", ssa_instructions2=ssa_instructions2)
+            elif mode == "multi":
+                # The reference is parsed, converted and encoded once; every variant
+                # is checked incrementally against it in the same solver run.
+                variant_ssas = []
+                for i, variant_code in enumerate(split_variants(code2), 1):
+                    with timer.stage("parse"):
+                        parse_result = pipeline.parse_program(variant_code, guard)
+                    if isinstance(parse_result, str):
+                        raise ValueError(f"Variant {i}: {parse_result}")
+                    _, _, variant_node = parse_result
+                    with timer.stage("unroll"):
+                        variant_depths, variant_bounds = plan_unrolling(variant_node, depth, auto_depth)
+                        request_budget.check_unroll(variant_node, depth, f"Variant {i}", variant_depths)
+                        result["unrolled"] += f"\n\n=== Variant {i} Unrolled ===\n" + variant_bounds + generate_unrolled_code(variant_node, depth, variant_depths)
+                    with timer.stage("ssa"):
+                        variant_ssa = pipeline.convert(variant_node, unroll_depth=depth, guard=guard, loop_depths=variant_depths,
+                                                   phi_placement=PHI_PLACEMENT)
+                    result["ssa"] += f"\n\n=== Variant {i} SSA ===\n" + "\n".join(str(instr) for instr in variant_ssa)
+                    variant_ssas.append(variant_ssa)
+                    solved_ssa += variant_ssa
+                    solved_depth = max(solved_depth, effective_depth(variant_depths, depth))
+                with timer.stage("smt"):
+                    smt_output = smt_generator.generate_multi_equivalence_smt(ssa_instructions1, variant_ssas)
             else:
-                smt_output = smt_generator.generate_smt(ssa_instructions1, mode="verification")
+                with timer.stage("smt"):
+                    smt_output = smt_generator.generate_smt(ssa_instructions1, mode="verification")
 
+            pipeline.log_stats()
             logging.debug(f"Raw SMT Output:\n{smt_output}")
             result["smt_result"] = smt_output
+            result["parsed"] = json.dumps(asts, separators=(",", ":"))
 
-            z3_status, z3_model = run_z3(smt_output)
+            features = query_features(solved_ssa, solved_depth, smt_output)
+            use_cubes = mode != "multi" and cubes and cube_solver.applicable(smt_output)
+            use_portfolio = mode != "multi" and not use_cubes and portfolio
+            # Parallel solvers hold one lane slot per Z3 process they run at once
+            if use_cubes:
+                workers = cube_solver.fan_out(smt_output)
+            elif use_portfolio:
+                workers = solver_portfolio.fan_out(smt_output)
+            else:
+                workers = 1
+            queued = time.perf_counter()
+            with solve_scheduler.slot(features, guard, workers) as slot:
+                timer.add("queue", time.perf_counter() - queued)
+                with timer.stage("solve"):
+                    if mode == "multi":
+                        checks = smt_generator.variant_checks
+                        z3_status, z3_model = run_z3(smt_output, guard, parse=lambda output: parse_variant_output(output, checks))
+                        if z3_status != "error":
+                            result["variants"], z3_model = z3_model, []
+                    elif use_cubes:
+                        z3_status, z3_model, result["cube_summary"] = run_z3_cubes(smt_output, guard, slot.workers)
+                    elif use_portfolio:
+                        z3_status, z3_model, winner = run_z3_portfolio(smt_output, guard, slot.workers)
+                        result["solver_config"] = winner or ""
+                    else:
+                        z3_status, z3_model = run_z3(smt_output, guard)
+                slot.status = z3_status
             result["counterexamples"] = z3_model
             result["status"] = z3_status
+            # The bulky outputs stay server-side; each tab fetches its artifact on demand
+            with timer.stage("store"):
+                result["result_id"] = store_artifacts(result)
 
+        except Cancelled as e:
+            logging.info(f"Job {guard.job_id} cancelled: {str(e)}")
+            result["error"] = f"Analysis cancelled: {str(e)}"
         except Exception as e:
             logging.error(f"Error in processing: {str(e)}")
             result["error"] = f"Error: {str(e)}"
+        finally:
+            job_registry.release(guard)
+            if profiler:
+                attach_profile(profiler, result)
+
+    return render_template('index.html', result=result, code1=code1, code2=code2, depth=depth, mode=mode, portfolio=portfolio, cubes=cubes, invariants=invariants, auto_depth=auto_depth)
+
+@app.after_request
+def add_server_timing(response):
+    """Expose the per-stage times of the analysis (parse, unroll, ssa, smt, queue, solve, store, total)."""
+    timer = g.get("stage_timer")
+    if timer and timer.durations:
+        response.headers["Server-Timing"] = timer.header()
+    return response
+
+def store_artifacts(result):
+    artifacts = {"ast": result["parsed"], "unrolled": result["unrolled"], "ssa": result["ssa"], "smt": result["smt_result"]}
+    return artifact_store.create({name: Artifact(text, ARTIFACT_TYPES[name]) for name, text in artifacts.items()})
+
+def attach_profile(profiler, result):
+    """Stop the request's profiler and store its output with the result, creating one if the request failed."""
+    profiler.stop()
+    if not result["result_id"]:
+        result["result_id"] = artifact_store.create({})
+    for name, artifact in profiler.artifacts().items():
+        artifact_store.add(result["result_id"], name, artifact)
+    logging.info(f"Profiled request {result['result_id']} in {profiler.elapsed:.3f}s")
+
+def artifact_response(body, content_type, headers, gzipped=None):
+    """gzip the body when the client accepts it and it is worth compressing."""
+    if "gzip" in request.headers.get("Accept-Encoding", "") and len(body) > 1024:
+        body = gzipped if gzipped is not None else gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, content_type=content_type, headers=headers)
+
+@app.route('/result/<result_id>/<name>')
+def result_artifact(result_id, name):
+    """
+    Serve one stored artifact of a result. ?offset=&limit= returns a range of
+    lines (with X-Total-Lines / X-Next-Offset headers), a Range: bytes=a-b
+    header returns a byte range, otherwise the whole artifact is sent.
+    """
+    artifact = artifact_store.get(result_id, name)
+    if artifact is None:
+        return "Result expired or not found. Please run the analysis again.", 404
+    headers = {"Cache-Control": "private, max-age=300", "Accept-Ranges": "bytes", "Vary": "Accept-Encoding"}
+    if artifact.filename:
+        headers["Content-Disposition"] = f'attachment; filename="{artifact.filename}"'
+
+    if "offset" in request.args or "limit" in request.args:
+        try:
+            offset = max(0, int(request.args.get("offset", 0)))
+            limit = min(max(1, int(request.args.get("limit", 500))), 10000)
+        except ValueError:
+            return "Invalid offset or limit", 400
+        lines = artifact.lines
+        headers["X-Total-Lines"] = str(len(lines))
+        if offset + limit < len(lines):
+            headers["X-Next-Offset"] = str(offset + limit)
+        body = "\n".join(lines[offset:offset + limit]).encode("utf-8")
+        return artifact_response(body, artifact.content_type, headers)
+
+    range_header = request.headers.get("Range")
+    if range_header:
+        total = len(artifact.data)
+        match = re.fullmatch(r'bytes=(\d*)-(\d*)', range_header.strip())
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), total - 1) if match.group(2) else total - 1
+            else:
+                start = max(0, total - int(match.group(2)))
+                end = total - 1
+            if start <= end:
+                headers["Content-Range"] = f"bytes {start}-{end}/{total}"
+                return Response(artifact.data[start:end + 1], status=206, content_type=artifact.content_type, headers=headers)
+        headers["Content-Range"] = f"bytes */{total}"
+        return Response(status=416, headers=headers)
+
+    return artifact_response(artifact.data, artifact.content_type, headers, artifact.gzipped)
 
-    return render_template('index.html', result=result, code1=code1, code2=code2, depth=depth, mode=mode)
+@app.route('/cancel/<job_id>', methods=['POST'])
+def cancel(job_id):
+    """Called by the page (via sendBeacon) when the user leaves while a job is still running."""
+    if job_registry.cancel(job_id):
+        logging.info(f"Job {job_id} cancelled by client")
+    return "", 204
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
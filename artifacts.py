@@ -0,0 +1,73 @@
+import gzip
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class Artifact:
+    def __init__(self, content, content_type="text/plain; charset=utf-8", filename=None):
+        self.data = content.encode("utf-8") if isinstance(content, str) else content
+        self.content_type = content_type
+        # Set for artifacts meant to be downloaded rather than shown in a tab
+        self.filename = filename
+        self._lines = None
+        self._gzipped = None
+
+    @property
+    def lines(self):
+        if self._lines is None:
+            self._lines = self.data.decode("utf-8", errors="replace").split("\n")
+        return self._lines
+
+    @property
+    def gzipped(self):
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.data, compresslevel=6)
+        return self._gzipped
+
+
+class ArtifactStore:
+    """
+    Server-side storage for the bulky per-result outputs (AST, unrolled code,
+    SSA, SMT). The page only receives a result id and fetches each tab's
+    artifact when it is opened. Results expire after ttl seconds and at most
+    max_results are kept, oldest first out.
+    """
+
+    def __init__(self, ttl=900, max_results=200):
+        self.ttl = ttl
+        self.max_results = max_results
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+
+    def create(self, artifacts):
+        result_id = uuid.uuid4().hex
+        entry = {name: value if isinstance(value, Artifact) else Artifact(value) for name, value in artifacts.items()}
+        with self.lock:
+            self._purge()
+            self.results[result_id] = (time.monotonic(), entry)
+            while len(self.results) > self.max_results:
+                self.results.popitem(last=False)
+        return result_id
+
+    def add(self, result_id, name, artifact):
+        with self.lock:
+            if result_id in self.results:
+                self.results[result_id][1][name] = artifact
+
+    def get(self, result_id, name):
+        with self.lock:
+            self._purge()
+            entry = self.results.get(result_id)
+            if entry is None:
+                return None
+            return entry[1].get(name)
+
+    def _purge(self):
+        cutoff = time.monotonic() - self.ttl
+        while self.results:
+            result_id, (created, _) = next(iter(self.results.items()))
+            if created >= cutoff:
+                break
+            self.results.popitem(last=False)
@@ -0,0 +1,267 @@
+import re
+
+KEYWORDS = ('if', 'else', 'while', 'for', 'assert', 'True', 'False')
+
+
+def expression_variables(expr):
+    """Variables and arrays read by a source expression."""
+    return {v for v in re.findall(r'\b[a-zA-Z_]\w*\b', expr) if v not in KEYWORDS}
+
+
+class BasicBlock:
+    """
+    A straight-line run of operations. Operations are tuples:
+        ("assign", var, expr)   ("store", array, index, expr)
+        ("assert", cond, path)  ("cond", cond_var, cond)
+    where path lists the (cond_var, taken) decisions of the enclosing ifs and
+    loop iterations.
+    A join block records the branch it closes as (cond_var, true_pred, false_pred).
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.ops = []
+        self.succs = []
+        self.preds = []
+        self.branch = None
+
+    def __repr__(self):
+        return f"B{self.index}"
+
+    def uses_and_defs(self):
+        """(upward-exposed uses, definitions) of the block, for liveness."""
+        uses, defs = set(), set()
+
+        def read(variables):
+            uses.update(v for v in variables if v not in defs)
+
+        for op in self.ops:
+            if op[0] == "assign":
+                read(expression_variables(op[2]))
+                defs.add(op[1])
+            elif op[0] == "store":
+                read(expression_variables(op[2]) | expression_variables(op[3]) | {op[1]})
+                defs.add(op[1])
+            elif op[0] == "assert":
+                read(expression_variables(op[1]))
+            else:
+                read(expression_variables(op[2]))
+        return uses, defs
+
+
+class ControlFlowGraph:
+    """
+    Control-flow graph of a region of the program, with loops unrolled the way
+    the SSA encoding runs them: every iteration is an if without else on the
+    loop condition, so iterations past the loop's exit change nothing. The
+    graph is therefore acyclic; the analyses below do not rely on that.
+    """
+
+    def __init__(self):
+        self.blocks = []
+        self.entry = self.new_block()
+        self.exit = self.entry
+
+    def new_block(self):
+        block = BasicBlock(len(self.blocks))
+        self.blocks.append(block)
+        return block
+
+    @staticmethod
+    def edge(source, target):
+        source.succs.append(target)
+        target.preds.append(source)
+
+    @classmethod
+    def build(cls, statements, new_cond_var, unroll_depth, loop_depths=None):
+        """CFG of a statement list; new_cond_var() names each branch and loop-iteration condition."""
+        cfg = cls()
+        cfg.new_cond_var = new_cond_var
+        cfg.unroll_depth = unroll_depth
+        cfg.loop_depths = loop_depths or {}
+        cfg.path = []
+        cfg.exit = cfg._statements(statements, cfg.entry)
+        return cfg
+
+    def _statements(self, statements, block):
+        for stmt in statements:
+            block = self._statement(stmt, block)
+        return block
+
+    def _statement(self, stmt, block):
+        if stmt.type == "Assign":
+            block.ops.append(("assign", stmt.variable, stmt.expression))
+        elif stmt.type == "ArrayAssign":
+            block.ops.append(("store", stmt.array, stmt.index, stmt.expression))
+        elif stmt.type == "Assert":
+            block.ops.append(("assert", stmt.condition, tuple(self.path)))
+        elif stmt.type == "If":
+            cond_var = self.new_cond_var()
+            block.ops.append(("cond", cond_var, stmt.condition))
+            then_block = self.new_block()
+            self.edge(block, then_block)
+            self.path.append((cond_var, True))
+            true_end = self._statements(stmt.true_branch.statements, then_block)
+            self.path.pop()
+            false_end = block
+            if stmt.false_branch:
+                else_block = self.new_block()
+                self.edge(block, else_block)
+                self.path.append((cond_var, False))
+                false_end = self._statements(stmt.false_branch.statements, else_block)
+                self.path.pop()
+            join = self.new_block()
+            self.edge(true_end, join)
+            self.edge(false_end, join)
+            join.branch = (cond_var, true_end, false_end)
+            return join
+        elif stmt.type in ("While", "For"):
+            if stmt.type == "For":
+                var, init = (part.strip() for part in stmt.init.split(":=", 1))
+                block.ops.append(("assign", var, init))
+            for _ in range(self.loop_depths.get(id(stmt), self.unroll_depth)):
+                cond_var = self.new_cond_var()
+                block.ops.append(("cond", cond_var, stmt.condition))
+                body_block = self.new_block()
+                self.edge(block, body_block)
+                self.path.append((cond_var, True))
+                body_end = self._statements(stmt.body.statements, body_block)
+                self.path.pop()
+                if stmt.type == "For":
+                    var, update = (part.strip() for part in stmt.update.split(":=", 1))
+                    body_end.ops.append(("assign", var, update))
+                join = self.new_block()
+                self.edge(body_end, join)
+                self.edge(block, join)
+                join.branch = (cond_var, body_end, block)
+                block = join
+        return block
+
+    def reverse_postorder(self):
+        """Blocks in reverse postorder, with the true side of a branch before the false side."""
+        order, visited = [], {self.entry}
+        stack = [(self.entry, iter(reversed(self.entry.succs)))]
+        while stack:
+            block, successors = stack[-1]
+            for succ in successors:
+                if succ not in visited:
+                    visited.add(succ)
+                    stack.append((succ, iter(reversed(succ.succs))))
+                    break
+            else:
+                stack.pop()
+                order.append(block)
+        order.reverse()
+        return order
+
+    def dominators(self, order=None):
+        """Immediate dominator of every reachable block (Cooper, Harvey and Kennedy)."""
+        order = order or self.reverse_postorder()
+        rank = {block: i for i, block in enumerate(order)}
+        idom = {self.entry: self.entry}
+
+        def intersect(a, b):
+            while a is not b:
+                while rank[a] > rank[b]:
+                    a = idom[a]
+                while rank[b] > rank[a]:
+                    b = idom[b]
+            return a
+
+        changed = True
+        while changed:
+            changed = False
+            for block in order[1:]:
+                processed = [pred for pred in block.preds if pred in idom]
+                new_idom = processed[0]
+                for pred in processed[1:]:
+                    new_idom = intersect(pred, new_idom)
+                if idom.get(block) is not new_idom:
+                    idom[block] = new_idom
+                    changed = True
+        return idom
+
+    def dominance_frontiers(self, idom):
+        frontiers = {block: set() for block in idom}
+        for block in idom:
+            if len(block.preds) < 2:
+                continue
+            for pred in block.preds:
+                runner = pred
+                while runner is not idom[block]:
+                    frontiers[runner].add(block)
+                    runner = idom[runner]
+        return frontiers
+
+    def liveness(self, live_out, order=None):
+        """Variables live on entry to each block, given those live at the exit."""
+        order = order or self.reverse_postorder()
+        summary = {block: block.uses_and_defs() for block in order}
+        live_in = {block: set() for block in order}
+        changed = True
+        while changed:
+            changed = False
+            for block in reversed(order):
+                out = set(live_out) if block is self.exit else set()
+                for succ in block.succs:
+                    out |= live_in[succ]
+                uses, defs = summary[block]
+                new_in = uses | (out - defs)
+                if new_in != live_in[block]:
+                    live_in[block] = new_in
+                    changed = True
+        return live_in
+
+    def place_phis(self, live_out):
+        """
+        Pruned Cytron placement: a variable gets a phi at the iterated dominance
+        frontier of its definitions, but only where it is live on entry.
+        Returns (reverse postorder, immediate dominators, {block: variables}).
+        """
+        order = self.reverse_postorder()
+        idom = self.dominators(order)
+        frontiers = self.dominance_frontiers(idom)
+        live_in = self.liveness(live_out, order)
+        definitions = {}
+        for block in order:
+            for op in block.ops:
+                if op[0] in ("assign", "store"):
+                    definitions.setdefault(op[1], set()).add(block)
+
+        phis = {block: set() for block in order}
+        for var, blocks in definitions.items():
+            work, placed = list(blocks), set()
+            while work:
+                for frontier in frontiers[work.pop()]:
+                    if frontier not in placed and var in live_in[frontier]:
+                        placed.add(frontier)
+                        phis[frontier].add(var)
+                        work.append(frontier)
+        return order, idom, phis
+
+
+def statement_reads(stmt):
+    """Every variable or array a statement may read."""
+    if stmt.type == "Assign":
+        return expression_variables(stmt.expression)
+    if stmt.type == "ArrayAssign":
+        return expression_variables(stmt.index) | expression_variables(stmt.expression) | {stmt.array}
+    if stmt.type == "Assert":
+        return expression_variables(stmt.condition)
+    reads = expression_variables(stmt.condition)
+    if stmt.type == "For":
+        reads |= expression_variables(stmt.init.split(":=", 1)[1]) | expression_variables(stmt.update.split(":=", 1)[1])
+    blocks = [stmt.body] if stmt.type in ("While", "For") else [stmt.true_branch] + ([stmt.false_branch] if stmt.false_branch else [])
+    for block in blocks:
+        for inner in block.statements:
+            reads |= statement_reads(inner)
+    return reads
+
+
+def statement_live_in(stmt, live_out):
+    """
+    Variables live before a top-level statement, conservatively: only a plain
+    assignment counts as a definition that kills liveness.
+    """
+    kills = {stmt.variable} if stmt.type == "Assign" else set()
+    return statement_reads(stmt) | (set(live_out) - kills)
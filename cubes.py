@@ -0,0 +1,166 @@
+import itertools
+import logging
+import math
+import os
+import queue
+import re
+import subprocess
+import threading
+import time
+from collections import Counter
+from governance import Cancelled
+from portfolio import first_status
+
+# Boolean terms the SSA form introduces for branch decisions (with or without a program prefix)
+BRANCH_TERM = re.compile(r'\(declare-fun ((?:cond_\d+|while_cond|for_cond)\w*) \(\) Bool\)')
+
+
+DEFINITION = re.compile(r'^\(assert \(= ([A-Za-z_]\w*) (.*)\)\)$')
+OPERATORS = {"ite", "and", "or", "not", "true", "false", "div", "mod", "abs", "distinct", "select", "store"}
+
+
+def determined_terms(smt_code):
+    """
+    Terms whose definition only involves constants and other such terms. The
+    solver decides them by propagation alone, so splitting on one only adds
+    a trivially refuted cube.
+    """
+    determined = set()
+    for line in smt_code.split("\n"):
+        match = DEFINITION.match(line.strip())
+        if match and all(name in OPERATORS or name in determined
+                         for name in re.findall(r'[A-Za-z_]\w*', match.group(2))):
+            determined.add(match.group(1))
+    return determined
+
+
+def cube_literal(term, value):
+    return term if value else f"(not {term})"
+
+
+class CubeSolver:
+    """
+    Cube-and-conquer: split a query on a few branch-condition terms and solve
+    each assignment (cube) in its own Z3 process. The query is sat as soon as
+    one cube is sat and unsat once every cube is refuted.
+    """
+
+    def __init__(self, z3_path, max_workers=None, max_variables=None, timeout=10):
+        self.z3_path = z3_path
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # Two cubes per worker by default, so a hard cube does not leave the other cores idle
+        self.max_variables = max_variables or min(6, math.ceil(math.log2(self.max_workers)) + 1)
+        self.timeout = timeout
+
+    def applicable(self, smt_code):
+        """Cubes are added as assertions, so the script must have a single plain (check-sat)."""
+        return smt_code.count("(check-sat)") == 1 and "(check-sat-" not in smt_code
+
+    def select_variables(self, smt_code):
+        """
+        The input-dependent branch terms used most often in the script: a
+        condition that selects between many phi values fixes the most of the
+        rest of the query. Ties go to the earlier branch, which feeds
+        everything after it.
+        """
+        counts = Counter(re.findall(r'[A-Za-z_]\w*', smt_code))
+        determined = determined_terms(smt_code)
+        terms = [term for term in BRANCH_TERM.findall(smt_code) if term not in determined]
+        ranked = sorted(enumerate(terms), key=lambda item: (-counts[item[1]], item[0]))
+        return [term for _, term in ranked[:self.max_variables]]
+
+    def cubes(self, variables):
+        return [[cube_literal(term, value) for term, value in zip(variables, values)]
+                for values in itertools.product((True, False), repeat=len(variables))]
+
+    def fan_out(self, smt_code):
+        """Most Z3 processes solve() runs at once on the query."""
+        return min(self.max_workers, len(self.cubes(self.select_variables(smt_code))))
+
+    def build_query(self, smt_code, cube):
+        assertions = "".join(f"(assert {literal})\n" for literal in cube)
+        return smt_code.replace("(check-sat)", assertions + "(check-sat)", 1)
+
+    def solve(self, smt_code, guard=None, max_workers=None):
+        """
+        Returns (raw output, summary dict). The output is the model of the first
+        sat cube, "unsat" when all cubes are refuted, or the output of a cube
+        that ended unknown. A guard, when given, supplies the solver budget and
+        cancels every running cube; max_workers lowers the number of cubes
+        solved at once.
+        """
+        workers = min(max_workers or self.max_workers, self.max_workers)
+        timeout = self.timeout
+        memory_mb = None
+        if guard:
+            timeout = max(1, min(guard.budget.solver_timeout, int(guard.remaining())))
+            memory_mb = guard.budget.solver_memory_mb
+        variables = self.select_variables(smt_code)
+        pending = list(enumerate(self.cubes(variables)))
+        total = len(pending)
+        running = {}
+        results = queue.Queue()
+        started = time.monotonic()
+        refuted = 0
+        answer = None
+        inconclusive = None
+
+        def launch(index, cube):
+            command = [self.z3_path, "-in", f"-T:{timeout}"] + ([f"-memory:{memory_mb}"] if memory_mb else [])
+            process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT, text=True)
+            if guard:
+                guard.budget.limit_solver(process)
+            running[index] = process
+
+            def wait():
+                try:
+                    output, _ = process.communicate(self.build_query(smt_code, cube))
+                except Exception as e:
+                    output = f"(error \"{e}\")"
+                results.put((index, output))
+
+            threading.Thread(target=wait, daemon=True).start()
+
+        try:
+            while pending and len(running) < workers:
+                launch(*pending.pop(0))
+
+            # Every cube may use the full solver timeout, but the request's deadline still applies
+            limit = timeout * math.ceil(total / workers)
+            if guard:
+                limit = min(limit, guard.remaining())
+            deadline = started + limit + 5
+            while running:
+                try:
+                    index, output = results.get(timeout=0.1)
+                except queue.Empty:
+                    if guard and guard.cancelled:
+                        raise Cancelled(guard.reason)
+                    if time.monotonic() > deadline:
+                        break
+                    continue
+                running.pop(index, None)
+                status = first_status(output)
+                logging.debug(f"Cube {index + 1}/{total} finished with {status}")
+                if status == "sat":
+                    answer = output
+                    break
+                if status == "unsat":
+                    refuted += 1
+                elif inconclusive is None:
+                    inconclusive = output
+                if pending:
+                    launch(*pending.pop(0))
+        finally:
+            for process in running.values():
+                if process.poll() is None:
+                    process.kill()
+
+        elapsed = time.monotonic() - started
+        summary = {"variables": variables, "cubes": total, "refuted": refuted, "elapsed": elapsed}
+        if answer is None and refuted == total:
+            answer = "unsat"
+        if answer is None:
+            answer = inconclusive or "unknown"
+        return answer, summary
@@ -0,0 +1,182 @@
+import logging
+import os
+import subprocess
+import threading
+import time
+import uuid
+
+try:
+    import resource
+except ImportError:  # Windows has no rlimits (and macOS no prlimit); Z3's own -memory flag still applies
+    resource = None
+
+
+class BudgetExceeded(ValueError):
+    """Raised when a request would exceed one of its resource budgets."""
+
+
+class Cancelled(Exception):
+    """Raised at a checkpoint once the job has been cancelled or has run out of time."""
+
+
+class RequestBudget:
+    """Per-request limits. Every value can be overridden through an FM_* environment variable."""
+
+    DEFAULTS = {
+        "max_unroll_work": 20000,
+        "max_ssa_instructions": 50000,
+        "solver_timeout": 10,
+        "solver_memory_mb": 1024,
+        "request_timeout": 60,
+    }
+
+    def __init__(self, **limits):
+        for name, default in self.DEFAULTS.items():
+            setattr(self, name, limits.get(name, default))
+
+    @classmethod
+    def from_env(cls):
+        limits = {}
+        for name in cls.DEFAULTS:
+            value = os.environ.get(f"FM_{name.upper()}")
+            if value:
+                limits[name] = int(value)
+        return cls(**limits)
+
+    def check_unroll(self, ast, depth, label="Program", loop_depths=None):
+        work = estimate_unrolled_size(ast, depth, loop_depths)
+        if work > self.max_unroll_work:
+            raise BudgetExceeded(
+                f"{label} would unroll to about {work} statements at depth {depth}, "
+                f"above the limit of {self.max_unroll_work}. Lower the unroll depth or simplify the program."
+            )
+        return work
+
+    def check_ssa(self, count, label="Program"):
+        if count > self.max_ssa_instructions:
+            raise BudgetExceeded(
+                f"{label} produced more than {self.max_ssa_instructions} SSA instructions. "
+                f"Lower the unroll depth or simplify the program."
+            )
+
+    def limit_solver(self, process):
+        """
+        Cap the address space of a solver that was just started. The limit is set
+        from outside with prlimit instead of a preexec_fn, which is not safe to use
+        from the threaded server; the solver is still waiting for its input here.
+        """
+        if not hasattr(resource, "prlimit") or not self.solver_memory_mb:
+            return
+        # Leave headroom above Z3's own -memory limit so it can fail gracefully first
+        hard = self.solver_memory_mb * 1024 * 1024 * 2
+        try:
+            resource.prlimit(process.pid, resource.RLIMIT_AS, (hard, hard))
+        except OSError as e:
+            logging.warning(f"Could not limit solver memory: {e}")
+
+
+class RequestGuard:
+    """
+    Cooperative cancellation for one analysis job. Parser, SSAConverter and the
+    solver runners call check() at safe points; it raises Cancelled once the job
+    was cancelled (client gone) or its wall-clock budget ran out, and
+    BudgetExceeded when the SSA instruction budget is exceeded.
+    """
+
+    def __init__(self, budget=None, job_id=None):
+        self.budget = budget or RequestBudget()
+        self.job_id = job_id or uuid.uuid4().hex
+        self.deadline = time.monotonic() + self.budget.request_timeout
+        self.event = threading.Event()
+        self.reason = ""
+
+    def cancel(self, reason="Request was cancelled"):
+        self.reason = reason
+        self.event.set()
+
+    @property
+    def cancelled(self):
+        if not self.event.is_set() and time.monotonic() > self.deadline:
+            self.cancel(f"Request exceeded its {self.budget.request_timeout}s time budget")
+        return self.event.is_set()
+
+    def check(self, ssa_count=None):
+        if self.cancelled:
+            raise Cancelled(self.reason)
+        if ssa_count is not None:
+            self.budget.check_ssa(ssa_count)
+
+    def remaining(self):
+        return max(0.0, self.deadline - time.monotonic())
+
+
+class JobRegistry:
+    """Active guards by job id so a disconnecting client can cancel its own job."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    def register(self, guard):
+        with self.lock:
+            self.jobs[guard.job_id] = guard
+        return guard
+
+    def release(self, guard):
+        with self.lock:
+            self.jobs.pop(guard.job_id, None)
+
+    def cancel(self, job_id, reason="Client disconnected"):
+        with self.lock:
+            guard = self.jobs.get(job_id)
+        if guard:
+            guard.cancel(reason)
+            return True
+        return False
+
+
+def estimate_unrolled_size(block, depth, loop_depths=None):
+    """
+    Number of statements the program expands to when every loop is unrolled
+    depth times, or as many times as loop_depths (keyed by id(loop)) says.
+    """
+    loop_depths = loop_depths or {}
+    size = 0
+    for stmt in block.statements:
+        if stmt.type == "If":
+            size += 1 + estimate_unrolled_size(stmt.true_branch, depth, loop_depths)
+            if stmt.false_branch:
+                size += estimate_unrolled_size(stmt.false_branch, depth, loop_depths)
+        elif stmt.type == "While":
+            size += 1 + loop_depths.get(id(stmt), depth) * (1 + estimate_unrolled_size(stmt.body, depth, loop_depths))
+        elif stmt.type == "For":
+            size += 1 + loop_depths.get(id(stmt), depth) * (2 + estimate_unrolled_size(stmt.body, depth, loop_depths))
+        else:
+            size += 1
+    return size
+
+
+def communicate_guarded(process, input_text, guard=None, timeout=None, poll_interval=0.1):
+    """
+    Feed input_text to process and collect its output like Popen.communicate, but
+    kill the process as soon as the guard is cancelled or timeout seconds pass.
+    """
+    outcome = {}
+
+    def communicate():
+        outcome["output"], _ = process.communicate(input_text)
+
+    worker = threading.Thread(target=communicate, daemon=True)
+    worker.start()
+    deadline = time.monotonic() + timeout if timeout else None
+    while worker.is_alive():
+        worker.join(poll_interval)
+        if guard and guard.cancelled:
+            process.kill()
+            worker.join()
+            raise Cancelled(guard.reason)
+        if deadline and time.monotonic() > deadline:
+            process.kill()
+            worker.join()
+            raise subprocess.TimeoutExpired(process.args, timeout)
+    return outcome.get("output", "")
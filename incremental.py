@@ -0,0 +1,160 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from parser import Parser, Node
+from ssa_converter import SSAConverter
+from smt_generator import SMTGenerator
+from governance import Cancelled
+from intervals import nested_loops
+
+
+class LRUCache:
+    """Small thread-safe LRU map with hit/miss counters."""
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+def fingerprint(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def statement_hash(stmt):
+    return fingerprint(json.dumps(stmt.to_dict(), sort_keys=True))
+
+
+def split_top_level(lines):
+    """
+    Group preprocessed program lines into top-level statements (a simple
+    statement, or a whole if/else, while or for block). Returns None when the
+    braces do not balance, so the caller can fall back to a full parse.
+    """
+    chunks = []
+    current = []
+    depth = 0
+    for i, line in enumerate(lines):
+        current.append(line)
+        depth += line.count('{') - line.count('}')
+        if depth < 0:
+            return None
+        next_line = lines[i + 1] if i + 1 < len(lines) else ""
+        if depth == 0 and not next_line.startswith("else"):
+            chunks.append(current)
+            current = []
+    if current:
+        return None
+    return chunks
+
+
+class IncrementalPipeline:
+    """
+    Memoizes the parse -> SSA -> SMT pipeline per top-level statement so that
+    re-submitting a slightly edited program only redoes the work for the edit:
+
+    - AST fragments are cached by the text of each top-level statement and
+      copied into each program, so no two statements share Node objects,
+    - SSA fragments by (statement hash, phi placement, unrolling mode, which of
+      its variables are live afterwards, incoming versions of the variables the
+      statement touches), so unchanged statements are cache hits unless the
+      edit shifted the versions they read or what is read after them,
+    - SMT translations by SSA expression text (versions are part of that text).
+    """
+
+    def __init__(self, max_entries=4096):
+        self.ast_cache = LRUCache(max_entries)
+        self.graph_cache = LRUCache(256)
+        self.ssa_cache = LRUCache(max_entries)
+        self.smt_cache = LRUCache(max_entries * 4)
+
+    def parse_program(self, code, guard=None):
+        """Same contract as Parser.parse_program: (AST dict, PNG path, AST Node) or an error message."""
+        parser = Parser(guard)
+        try:
+            lines = parser._preprocess_lines(code)
+            chunks = split_top_level(lines)
+            if chunks is None:
+                return parser.parse_program(code)
+
+            statements = []
+            for chunk in chunks:
+                key = fingerprint("\n".join(chunk))
+                nodes = self.ast_cache.get(key)
+                if nodes is None:
+                    chunk_parser = Parser(guard)
+                    chunk_parser.lines = chunk
+                    nodes = chunk_parser.parse().statements
+                    self.ast_cache.put(key, nodes)
+                # Every AST gets its own nodes: loop bounds and unroll depths are keyed by id(node)
+                statements.extend(copy.deepcopy(nodes))
+            ast = Node("Block", statements=statements)
+
+            graph_key = fingerprint("\n".join(lines))
+            png_path = self.graph_cache.get(graph_key)
+            if png_path is None or not os.path.exists(png_path):
+                png_path = parser.save_ast_graph(ast)
+                self.graph_cache.put(graph_key, png_path)
+            return ast.to_dict(), png_path, ast
+        except Cancelled:
+            raise
+        except Exception as e:
+            return f"Parsing error: {str(e)}"
+
+    def convert(self, ast, unroll_depth=0, guard=None, loop_depths=None, live_out=None, phi_placement="minimal"):
+        """Same result as SSAConverter.convert, reusing cached per-statement fragments."""
+        converter = SSAConverter(guard, phi_placement)
+        converter.reset()
+        converter.loop_depths = loop_depths or {}
+        depth = unroll_depth if converter.uses_unrolling(ast, unroll_depth) else 0
+        if phi_placement == "minimal":
+            live_outs = converter.live_outs(ast.statements, live_out)
+        else:
+            live_outs = [None] * len(ast.statements)
+        for stmt, stmt_live_out in zip(ast.statements, live_outs):
+            variables = converter.footprint(stmt)
+            loops = ([stmt] if stmt.type in ("While", "For") else []) + nested_loops(stmt)
+            unrolling = tuple(converter.loop_depths.get(id(loop), depth) for loop in loops)
+            # Liveness only matters for the variables the statement defines
+            live = None if stmt_live_out is None else tuple(sorted(stmt_live_out & set(variables)))
+            key = (statement_hash(stmt), phi_placement, depth, unrolling, live, converter.state_key(variables))
+            cached = self.ssa_cache.get(key)
+            if cached is not None:
+                instructions, state = cached
+                converter.instructions.extend(instructions)
+                converter.restore_state(state)
+                continue
+            start = len(converter.instructions)
+            converter.convert_statement(stmt, depth, stmt_live_out)
+            self.ssa_cache.put(key, (converter.instructions[start:], converter.snapshot_state(variables)))
+        return converter.instructions
+
+    def smt_generator(self, **options):
+        return SMTGenerator(translation_cache=self.smt_cache, **options)
+
+    def log_stats(self):
+        for name in ("ast_cache", "ssa_cache", "smt_cache"):
+            cache = getattr(self, name)
+            logging.debug(f"{name}: {cache.hits} hits, {cache.misses} misses, {len(cache.entries)} entries")
@@ -0,0 +1,418 @@
+import re
+from smt_generator import tokenize
+
+INF = float("inf")
+ARRAY_READ = re.compile(r'\w+\[[^\]]*\]')
+
+
+class Interval:
+    """Closed integer interval [lo, hi]; lo/hi may be -inf/inf."""
+
+    def __init__(self, lo=-INF, hi=INF):
+        self.lo = lo
+        self.hi = hi
+
+    @classmethod
+    def constant(cls, value):
+        return cls(value, value)
+
+    def is_empty(self):
+        return self.lo > self.hi
+
+    def join(self, other):
+        return Interval(min(self.lo, other.lo), max(self.hi, other.hi))
+
+    def meet(self, other):
+        return Interval(max(self.lo, other.lo), min(self.hi, other.hi))
+
+    def __add__(self, other):
+        return Interval(self.lo + other.lo, self.hi + other.hi)
+
+    def __sub__(self, other):
+        return Interval(self.lo - other.hi, self.hi - other.lo)
+
+    def __neg__(self):
+        return Interval(-self.hi, -self.lo)
+
+    def __mul__(self, other):
+        # 0 * inf is 0 here: a zero bound stays zero whatever the other factor
+        products = [0 if a == 0 or b == 0 else a * b for a in (self.lo, self.hi) for b in (other.lo, other.hi)]
+        return Interval(min(products), max(products))
+
+    def __eq__(self, other):
+        return isinstance(other, Interval) and self.lo == other.lo and self.hi == other.hi
+
+    def __repr__(self):
+        return f"[{self.lo}, {self.hi}]"
+
+
+TOP = Interval()
+
+
+class ExpressionParser:
+    """Parses program expressions into small tuples for the interval evaluator."""
+
+    def __init__(self):
+        self.cache = {}
+
+    def parse(self, expr):
+        tree = self.cache.get(expr)
+        if tree is None:
+            # Array contents are not tracked: every element read is unknown
+            self.tokens = tokenize(ARRAY_READ.sub(" __array__ ", expr))
+            self.pos = 0
+            tree = self._or()
+            if self.pos != len(self.tokens):
+                raise ValueError(f"Unexpected '{self.tokens[self.pos]}' in expression: {expr}")
+            self.cache[expr] = tree
+        return tree
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _next(self):
+        token = self._peek()
+        if token is None:
+            raise ValueError("Unexpected end of expression")
+        self.pos += 1
+        return token
+
+    def _or(self):
+        terms = [self._and()]
+        while self._peek() == "||":
+            self._next()
+            terms.append(self._and())
+        return terms[0] if len(terms) == 1 else ("or", terms)
+
+    def _and(self):
+        terms = [self._not()]
+        while self._peek() == "&&":
+            self._next()
+            terms.append(self._not())
+        return terms[0] if len(terms) == 1 else ("and", terms)
+
+    def _not(self):
+        if self._peek() == "!":
+            self._next()
+            return ("not", self._not())
+        return self._comparison()
+
+    def _comparison(self):
+        left = self._additive()
+        if self._peek() in ("<", "<=", ">", ">=", "==", "=", "!="):
+            op = self._next()
+            return ("cmp", "==" if op == "=" else op, left, self._additive())
+        return left
+
+    def _additive(self):
+        term = self._multiplicative()
+        while self._peek() in ("+", "-"):
+            term = (self._next(), term, self._multiplicative())
+        return term
+
+    def _multiplicative(self):
+        term = self._unary()
+        while self._peek() in ("*", "/", "%"):
+            term = (self._next(), term, self._unary())
+        return term
+
+    def _unary(self):
+        if self._peek() == "-":
+            self._next()
+            return ("neg", self._unary())
+        if self._peek() == "!":
+            self._next()
+            return ("not", self._unary())
+        token = self._next()
+        if token == "(":
+            term = self._or()
+            if self._next() != ")":
+                raise ValueError("Expected ')' in expression")
+            return term
+        if token.isdigit():
+            return ("num", int(token))
+        if token in ("True", "true"):
+            return ("bool", True)
+        if token in ("False", "false"):
+            return ("bool", False)
+        return ("var", token)
+
+
+class IntervalAnalysis:
+    """
+    Interval abstract interpreter over the AST. Loops are executed abstractly,
+    one iteration at a time, with the state refined by the loop condition, so
+    a loop whose condition becomes false in every abstract execution gets a
+    bound: the largest number of times its body can run on one visit. A loop
+    nested in another is visited many times and keeps the largest count over
+    all visits; the unrolled iterations it does not need on a visit are
+    skipped by their loop condition. Loops
+    that are still running after max_iterations, or once the analysis has
+    used up max_steps statements in total, are left unbounded (None).
+    """
+
+    def __init__(self, max_iterations=1000, max_steps=100000):
+        self.max_iterations = max_iterations
+        self.max_steps = max_steps
+        self.parser = ExpressionParser()
+        self.bounds = {}
+        self.loops = []
+        self.steps = 0
+
+    def analyze(self, ast):
+        """Returns {id(loop node): bound or None} for every While/For in the program."""
+        loops = [loop for stmt in ast.statements for loop in ([stmt] if stmt.type in ("While", "For") else []) + nested_loops(stmt)]
+        if len({id(loop) for loop in loops}) != len(loops):
+            # Bounds are keyed by node identity, so two positions sharing a node would share a bound
+            raise ValueError("the program shares loop nodes between statements")
+        self.bounds = {}
+        self.loops = []
+        self.steps = 0
+        self._block(ast.statements, {})
+        return self.bounds
+
+    # --- expressions -------------------------------------------------------
+
+    def evaluate(self, tree, env):
+        kind = tree[0]
+        if kind == "num":
+            return Interval.constant(tree[1])
+        if kind == "var":
+            return env.get(tree[1], TOP)
+        if kind == "neg":
+            return -self.evaluate(tree[1], env)
+        if kind in ("+", "-", "*"):
+            left, right = self.evaluate(tree[1], env), self.evaluate(tree[2], env)
+            return left + right if kind == "+" else left - right if kind == "-" else left * right
+        if kind in ("/", "%"):
+            left, right = self.evaluate(tree[1], env), self.evaluate(tree[2], env)
+            if left.lo == left.hi and right.lo == right.hi and 0 <= left.lo < INF and 0 < right.lo < INF:
+                value = left.lo // right.lo if kind == "/" else left.lo % right.lo
+                return Interval.constant(value)
+            return TOP
+        # A condition used as a value
+        may_true, may_false = self.truth(tree, env)
+        return Interval(0 if may_false else 1, 1 if may_true else 0)
+
+    def truth(self, tree, env):
+        """(may be true, may be false) of a condition in the given state."""
+        kind = tree[0]
+        if kind == "bool":
+            return tree[1], not tree[1]
+        if kind == "not":
+            may_true, may_false = self.truth(tree[1], env)
+            return may_false, may_true
+        if kind in ("and", "or"):
+            results = [self.truth(term, env) for term in tree[1]]
+            if kind == "and":
+                return all(t for t, _ in results), any(f for _, f in results)
+            return any(t for t, _ in results), all(f for _, f in results)
+        if kind == "cmp":
+            _, op, left, right = tree
+            a, b = self.evaluate(left, env), self.evaluate(right, env)
+            if op == "<":
+                return a.lo < b.hi, a.hi >= b.lo
+            if op == "<=":
+                return a.lo <= b.hi, a.hi > b.lo
+            if op == ">":
+                return a.hi > b.lo, a.lo <= b.hi
+            if op == ">=":
+                return a.hi >= b.lo, a.lo < b.hi
+            overlap = not a.meet(b).is_empty()
+            single = a.lo == a.hi == b.lo == b.hi
+            if op == "==":
+                return overlap, not single
+            return not single, overlap
+        value = self.evaluate(tree, env)
+        return value.lo != 0 or value.hi != 0, value.lo <= 0 <= value.hi
+
+    def refine(self, tree, env, outcome):
+        """The part of the state in which the condition evaluates to outcome, or None if there is none."""
+        may_true, may_false = self.truth(tree, env)
+        if not (may_true if outcome else may_false):
+            return None
+        kind = tree[0]
+        if kind == "not":
+            return self.refine(tree[1], env, not outcome)
+        if kind in ("and", "or"):
+            if (kind == "and") == outcome:
+                # Every part must have the outcome
+                for term in tree[1]:
+                    env = self.refine(term, env, outcome)
+                    if env is None:
+                        return None
+                return env
+            # Any part may have the outcome
+            return join_states([self.refine(term, env, outcome) for term in tree[1]])
+        if kind == "cmp":
+            _, op, left, right = tree
+            if not outcome:
+                op = {"<": ">=", "<=": ">", ">": "<=", ">=": "<", "==": "!=", "!=": "=="}[op]
+            env = self._narrow(env, left, op, self.evaluate(right, env))
+            if env is not None:
+                mirrored = {"<": ">", "<=": ">=", ">": "<", ">=": "<=", "==": "==", "!=": "!="}[op]
+                env = self._narrow(env, right, mirrored, self.evaluate(left, env))
+            return env
+        return env
+
+    def _narrow(self, env, term, op, other):
+        """Restrict a variable so that  term op other  can hold."""
+        if term[0] != "var":
+            return env
+        current = env.get(term[1], TOP)
+        limits = {"<": Interval(-INF, other.hi - 1), "<=": Interval(-INF, other.hi),
+                  ">": Interval(other.lo + 1, INF), ">=": Interval(other.lo, INF), "==": other}
+        if op not in limits:
+            return env
+        narrowed = current.meet(limits[op])
+        if narrowed.is_empty():
+            return None
+        env = dict(env)
+        env[term[1]] = narrowed
+        return env
+
+    # --- statements --------------------------------------------------------
+
+    def _block(self, statements, env):
+        for stmt in statements:
+            if env is None:
+                self._skip(stmt)
+                continue
+            self.steps += 1
+            if stmt.type == "Assign":
+                env = dict(env)
+                env[stmt.variable] = self.evaluate(self.parser.parse(stmt.expression), env)
+            elif stmt.type == "If":
+                condition = self.parser.parse(stmt.condition)
+                true_env = self._block(stmt.true_branch.statements, self.refine(condition, env, True))
+                false_env = self.refine(condition, env, False)
+                if stmt.false_branch:
+                    false_env = self._block(stmt.false_branch.statements, false_env)
+                env = join_states([true_env, false_env])
+            elif stmt.type == "While":
+                env = self._loop(stmt, stmt.body.statements, env)
+            elif stmt.type == "For":
+                init_var, init_expr = (part.strip() for part in stmt.init.split(":=", 1))
+                env = dict(env)
+                env[init_var] = self.evaluate(self.parser.parse(init_expr), env)
+                env = self._loop(stmt, stmt.body.statements, env, update=stmt.update)
+        return env
+
+    def _loop(self, loop, body, env, update=None):
+        self._register(loop)
+        condition = self.parser.parse(loop.condition)
+        update_var, update_tree = None, None
+        if update:
+            update_var, update_expr = (part.strip() for part in update.split(":=", 1))
+            update_tree = self.parser.parse(update_expr)
+
+        exits = []
+        iterations = 0
+        while env is not None:
+            exits.append(self.refine(condition, env, False))
+            if iterations >= self.max_iterations or self.steps >= self.max_steps:
+                # Give up on this loop: anything it modifies may hold any value afterwards
+                self._unbounded(loop)
+                widened = dict(env)
+                for var in modified_variables(body) | ({update_var} if update_var else set()):
+                    widened[var] = TOP
+                exits.append(self.refine(condition, widened, False))
+                return join_states(exits)
+            env = self.refine(condition, env, True)
+            if env is None:
+                break
+            env = self._block(body, env)
+            if env is not None and update_var:
+                env = dict(env)
+                env[update_var] = self.evaluate(update_tree, env)
+            iterations += 1
+
+        if self.bounds.get(id(loop), 0) is not None:
+            self.bounds[id(loop)] = max(self.bounds.get(id(loop), 0), iterations)
+        return join_states(exits)
+
+    def _unbounded(self, loop):
+        self.bounds[id(loop)] = None
+        for stmt in nested_loops(loop):
+            self.bounds[id(stmt)] = None
+
+    def _skip(self, stmt):
+        """Unreachable code: its loops never run."""
+        for loop in ([stmt] if stmt.type in ("While", "For") else []) + nested_loops(stmt):
+            self.bounds.setdefault(id(loop), 0)
+            self._register(loop)
+
+    def _register(self, loop):
+        if loop not in self.loops:
+            self.loops.append(loop)
+
+    def describe(self, depths=None):
+        """One line per loop with its bound (and the depth actually unrolled, if given)."""
+        lines = []
+        for loop in self.loops:
+            header = f"while ({loop.condition})" if loop.type == "While" else f"for ({loop.init}; {loop.condition}; {loop.update})"
+            bound = self.bounds.get(id(loop))
+            line = f"{header}: " + ("no bound found" if bound is None else f"at most {bound} iteration(s)")
+            if depths is not None and id(loop) in depths:
+                line += f", unrolled {depths[id(loop)]} time(s)"
+            lines.append(line)
+        return lines
+
+
+def join_states(states):
+    states = [state for state in states if state is not None]
+    if not states:
+        return None
+    joined = dict(states[0])
+    for state in states[1:]:
+        for var in set(joined) | set(state):
+            joined[var] = joined.get(var, TOP).join(state.get(var, TOP))
+    return joined
+
+
+def modified_variables(statements):
+    modified = set()
+    for stmt in statements:
+        if stmt.type == "Assign":
+            modified.add(stmt.variable)
+        elif stmt.type == "If":
+            modified |= modified_variables(stmt.true_branch.statements)
+            if stmt.false_branch:
+                modified |= modified_variables(stmt.false_branch.statements)
+        elif stmt.type in ("While", "For"):
+            modified |= modified_variables(stmt.body.statements)
+            if stmt.type == "For":
+                modified.add(stmt.init.split(":=", 1)[0].strip())
+    return modified
+
+
+def nested_loops(stmt):
+    blocks = []
+    if stmt.type == "If":
+        blocks = [stmt.true_branch] + ([stmt.false_branch] if stmt.false_branch else [])
+    elif stmt.type in ("While", "For"):
+        blocks = [stmt.body]
+    loops = []
+    for block in blocks:
+        for inner in block.statements:
+            if inner.type in ("While", "For"):
+                loops.append(inner)
+            loops.extend(nested_loops(inner))
+    return loops
+
+
+def loop_depths(analysis, unroll_depth, automatic=False):
+    """
+    Per-loop unroll depth: never more than the loop's proven bound; with
+    automatic depth, exactly the bound when there is one (unroll_depth is
+    then only used for loops without a bound). A nested loop gets one depth
+    for all its visits, the bound of its longest one.
+    """
+    depths = {}
+    for loop in analysis.loops:
+        bound = analysis.bounds.get(id(loop))
+        if bound is None:
+            depths[id(loop)] = unroll_depth
+        else:
+            depths[id(loop)] = bound if automatic else min(unroll_depth, bound)
+    return depths
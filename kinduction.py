@@ -0,0 +1,383 @@
+import re
+from parser import Node
+from cfg import expression_variables
+from ssa_converter import SSAConverter
+from smt_generator import SMTGenerator, ExpressionTranslator, model_value, tokenize
+
+MAX_PAIRWISE_VARIABLES = 8
+
+
+def conjunction(terms):
+    if not terms:
+        return "true"
+    return terms[0] if len(terms) == 1 else f"(and {' '.join(terms)})"
+
+
+def contains_loop(stmt):
+    if stmt.type in ("While", "For"):
+        return True
+    if stmt.type == "If":
+        branches = [stmt.true_branch] + ([stmt.false_branch] if stmt.false_branch else [])
+        return any(contains_loop(s) for branch in branches for s in branch.statements)
+    return False
+
+
+def solver_answers(output):
+    """(status, following lines) for every sat/unsat/unknown answer in a script's output."""
+    answers = []
+    for line in output.split('\n'):
+        line = line.strip()
+        if line in ("sat", "unsat", "unknown"):
+            answers.append((line, []))
+        elif answers and not line.startswith("(error"):
+            answers[-1][1].append(line)
+    return answers
+
+
+def model_values(lines):
+    return {term: model_value(value) for term, value in re.findall(r'\((\w+) (\(- \d+\)|[^\s()]+)\)', " ".join(lines))}
+
+
+class Fragment:
+    """A loop-free piece of the program in SSA form, reading every variable as its _0 version."""
+
+    def __init__(self, statements, variables, arrays, guard=None):
+        converter = SSAConverter()
+        converter.convert_fragment(statements, guard)
+        # Assert instructions keep the branch path they sit on
+        self.asserts = [instr for instr in converter.instructions if instr.target == "assert"]
+        self.instructions = [instr for instr in converter.instructions if instr.target != "assert"]
+        self.finals = {var: converter.final_version(var) for var in variables}
+
+    def constant_value(self, var):
+        """The integer a variable holds at the end of the fragment, if it is a plain constant."""
+        for instr in self.instructions:
+            if instr.target == self.finals.get(var) and re.fullmatch(r'-?\d+', instr.expression.strip()):
+                return int(instr.expression)
+        return None
+
+
+class LoopProgram:
+    """A program split around its loop: prefix; while (guard) { body }; suffix."""
+
+    def __init__(self, ast):
+        loops = [i for i, stmt in enumerate(ast.statements) if stmt.type in ("While", "For")]
+        if not loops:
+            raise ValueError("k-induction needs a program with a loop. Use Verification Mode for loop-free programs.")
+        if len(loops) > 1:
+            raise ValueError("k-induction supports a single top-level loop")
+        index = loops[0]
+        loop = ast.statements[index]
+        prefix = list(ast.statements[:index])
+        body = list(loop.body.statements)
+        suffix = list(ast.statements[index + 1:])
+        if loop.type == "For":
+            # for (init; cond; update) { body }  is  init; while (cond) { body; update }
+            init_var, init_expr = (part.strip() for part in loop.init.split(":=", 1))
+            update_var, update_expr = (part.strip() for part in loop.update.split(":=", 1))
+            prefix.append(Node("Assign", variable=init_var, expression=init_expr))
+            body.append(Node("Assign", variable=update_var, expression=update_expr))
+        if any(contains_loop(stmt) for stmt in prefix + body + suffix):
+            raise ValueError("k-induction does not support nested loops")
+
+        self.variables = sorted(SSAConverter().variables_in(prefix + body + suffix) | expression_variables(loop.condition))
+        self.arrays = self._array_names(prefix + body + suffix, loop.condition)
+        self.scalars = [var for var in self.variables if var not in self.arrays]
+        self.condition = loop.condition
+        self.body = body
+        self.suffix_statements = suffix
+
+        self.prefix = Fragment(prefix, self.variables, self.arrays)
+        self.step = Fragment(body, self.variables, self.arrays, guard=loop.condition)
+        self.suffix = Fragment(suffix, self.variables, self.arrays)
+        self.entry = {var: f"{var}_0" for var in self.variables}
+        if not (self.prefix.asserts or self.step.asserts or self.suffix.asserts):
+            raise ValueError("k-induction needs at least one assert to prove")
+
+    def _array_names(self, statements, condition):
+        text = condition + "\n" + "\n".join(self._statement_text(stmt) for stmt in statements)
+        return set(re.findall(r'(\w+)\[', text))
+
+    def _statement_text(self, stmt):
+        if stmt.type == "ArrayAssign":
+            return f"{stmt.array}[{stmt.index}] := {stmt.expression}"
+        if stmt.type == "Assign":
+            return stmt.expression
+        if stmt.type == "Assert":
+            return stmt.condition
+        if stmt.type == "If":
+            parts = [stmt.condition] + [self._statement_text(s) for s in stmt.true_branch.statements]
+            if stmt.false_branch:
+                parts.extend(self._statement_text(s) for s in stmt.false_branch.statements)
+            return "\n".join(parts)
+        return ""
+
+    def ssa_listing(self):
+        sections = [("Before the loop", self.prefix), ("One loop iteration", self.step), ("After the loop", self.suffix)]
+        lines = []
+        for title, fragment in sections:
+            lines.append(f"=== {title} ===")
+            lines.extend(str(instr) for instr in fragment.instructions)
+            lines.extend(str(instr) for instr in fragment.asserts)
+        return "\n".join(lines)
+
+
+class KInductionEngine:
+    """
+    Proves the assertions of a single-loop program by k-induction on the loop
+    head state instead of unrolling the loop:
+
+    - base case: the first k loop-head states reached from the initial state
+      satisfy the property (bounded model checking),
+    - inductive step: any k consecutive loop-head states satisfying the property
+      (and the inferred invariants) are followed by one that satisfies it too.
+
+    The property at a loop-head state is "the body's asserts hold if the loop
+    continues, the asserts after the loop hold if it exits". The loop body is
+    encoded once per frame, so the query size depends on k, not on the number
+    of iterations. solve(smt_code) runs the solver and returns its raw output.
+    """
+
+    def __init__(self, solve, max_k=5, invariants=True):
+        self.solve = solve
+        self.max_k = max_k
+        self.use_invariants = invariants
+        self.program = None
+        self.last_script = ""
+
+    def prove(self, ast):
+        """Returns {"status", "k", "invariants", "details"}; status follows the Counterexamples tab (unsat = holds)."""
+        self.program = LoopProgram(ast)
+        invariants = self.infer_invariants() if self.use_invariants else []
+        for k in range(1, self.max_k + 1):
+            script, watched = self._kinduction_script(k, invariants)
+            self.last_script = script
+            answers = solver_answers(self.solve(script))
+            base_status = answers[0][0] if answers else "unknown"
+            if base_status == "sat":
+                details = [f"Assertion violated within the first {k} loop iteration(s) (base case, k = {k}):"]
+                details.extend(self._trace(watched, model_values(answers[0][1])))
+                return {"status": "sat", "k": k, "invariants": invariants, "details": details}
+            if base_status != "unsat":
+                return self._inconclusive(k, invariants, f"The solver could not decide the base case for k = {k}.")
+            step_status = answers[-1][0] if len(answers) > 1 else "unknown"
+            if step_status == "unsat":
+                details = [f"Proved by {k}-induction: the assertions hold for every number of loop iterations."]
+                if invariants:
+                    details.append("Inductive invariants used: " + ", ".join(invariants))
+                return {"status": "unsat", "k": k, "invariants": invariants, "details": details}
+        return self._inconclusive(self.max_k, invariants,
+                                  f"The property is not {self.max_k}-inductive. Raise k or add assertions that strengthen it.")
+
+    def _inconclusive(self, k, invariants, message):
+        details = [message]
+        if invariants:
+            details.append("Inductive invariants found: " + ", ".join(invariants))
+        return {"status": "unknown", "k": k, "invariants": invariants, "details": details}
+
+    def _instantiate(self, generator, fragment, prefix):
+        """Encode a fragment under a frame prefix; returns its translated asserts."""
+        generator.encode(fragment.instructions, prefix)
+        return [generator.assertion_term(instr, prefix) for instr in fragment.asserts]
+
+    def _link(self, generator, finals, source, target):
+        """The state entering frame target is the state finals leaves in frame source."""
+        for var in self.program.variables:
+            start, final = f"{var}_0{target}", f"{finals[var]}{source}"
+            generator.referenced.update((start, final))
+            if var in self.program.arrays:
+                generator.array_terms.update((start, final))
+            if start != final:
+                generator.assertions.append(f"(assert (= {start} {final}))")
+
+    def _translate_state(self, generator, expr, prefix):
+        """Translate a source-level expression over the loop-head state of a frame."""
+        def rename(var):
+            term = f"{var}_0{prefix}"
+            generator.referenced.add(term)
+            return term
+
+        translator = ExpressionTranslator(rename)
+        term = translator.translate(expr)
+        generator.nonlinear = generator.nonlinear or translator.nonlinear
+        return term
+
+    def _loop_head(self, generator, prefix):
+        """Encode one loop-head frame with its exit path; returns (guard, property) terms."""
+        body_asserts = self._instantiate(generator, self.program.step, prefix)
+        self._link(generator, self.program.entry, prefix, f"{prefix}x")
+        post_asserts = self._instantiate(generator, self.program.suffix, f"{prefix}x")
+        guard = f"while_cond{prefix}"
+        prop = f"(and (=> {guard} {conjunction(body_asserts)}) (=> (not {guard}) {conjunction(post_asserts)}))"
+        return guard, prop
+
+    def _kinduction_script(self, k, invariants):
+        program = self.program
+        generator = SMTGenerator()
+
+        # Base case: initial state, then k loop-head states along the execution
+        prefix_asserts = self._instantiate(generator, program.prefix, "_p")
+        self._link(generator, program.prefix.finals, "_p", "_b0")
+        violations = [f"(not {conjunction(prefix_asserts)})"] if prefix_asserts else []
+        reach = "true"
+        for i in range(k):
+            guard, prop = self._loop_head(generator, f"_b{i}")
+            violations.append(f"(and {reach} (not {prop}))")
+            if i < k - 1:
+                self._link(generator, program.step.finals, f"_b{i}", f"_b{i + 1}")
+                generator.declarations.append(f"(declare-fun reach_b{i + 1} () Bool)")
+                generator.assertions.append(f"(assert (= reach_b{i + 1} (and {reach} {guard})))")
+                reach = f"reach_b{i + 1}"
+
+        # Inductive step: k iterations from an arbitrary state satisfying the property
+        hypotheses = []
+        for i in range(k + 1):
+            guard, prop = self._loop_head(generator, f"_s{i}")
+            hypotheses.extend(self._translate_state(generator, inv, f"_s{i}") for inv in invariants)
+            if i < k:
+                hypotheses.extend((prop, guard))
+                self._link(generator, program.step.finals, f"_s{i}", f"_s{i + 1}")
+            else:
+                hypotheses.append(f"(not {prop})")
+
+        generator.declarations.append("(declare-fun base_case () Bool)")
+        generator.declarations.append("(declare-fun inductive_step () Bool)")
+        generator.assertions.append(f"(assert (=> base_case {violations[0] if len(violations) == 1 else '(or ' + ' '.join(violations) + ')'}))")
+        generator.assertions.append(f"(assert (=> inductive_step {conjunction(hypotheses)}))")
+
+        # State worth showing for a base-case counterexample
+        watched = [(f"{var}_0_p", var, "input") for var in program.scalars if f"{var}_0_p" in generator.referenced]
+        for i in range(k):
+            watched.extend((f"{var}_0_b{i}", var, i) for var in program.scalars)
+            watched.append((f"while_cond_b{i}", "loop condition", i))
+
+        script = generator.script(["(check-sat-assuming (base_case))",
+                                   f"(get-value ({' '.join(term for term, _, _ in watched)}))",
+                                   "(check-sat-assuming (inductive_step))",
+                                   "(exit)"])
+        return script, watched
+
+    def _trace(self, watched, values):
+        lines = []
+        inputs = [f"{var} = {values.get(term, '?')}" for term, var, frame in watched if frame == "input"]
+        if inputs:
+            lines.append("Initial values: " + ", ".join(inputs))
+        frames = sorted({frame for _, _, frame in watched if frame != "input"})
+        for frame in frames:
+            state = [f"{var} = {values.get(term, '?')}" for term, var, f in watched if f == frame and var != "loop condition"]
+            condition = next((values.get(term, "?") for term, var, f in watched if f == frame and var == "loop condition"), "?")
+            lines.append(f"Loop head {frame}: " + ", ".join(state) + f" (loop condition {condition})")
+            if condition == "false":
+                break
+        return lines
+
+    def candidate_invariants(self):
+        """Simple candidate invariants over the loop-head state, to be filtered by infer_invariants."""
+        program = self.program
+        candidates = []
+        constants = {var: program.prefix.constant_value(var) for var in program.scalars}
+        constants = {var: value for var, value in constants.items() if value is not None}
+
+        # Bounds from the initial values
+        for var, value in constants.items():
+            candidates.extend((f"{var} >= {value}", f"{var} <= {value}"))
+
+        # Relaxed loop condition: a counter stepping past  i < n  stops at  i <= n
+        relaxed = {"<": "{0} <= {1}", "<=": "{0} <= ({1}) + 1", ">": "{0} >= {1}", ">=": "{0} >= ({1}) - 1"}
+        if "||" not in program.condition:
+            for atom in program.condition.split("&&"):
+                match = re.fullmatch(r'\s*\(?\s*(.+?)\s*(<=|>=|<|>)\s*(.+?)\s*\)?\s*', atom)
+                if match:
+                    left, op, right = match.groups()
+                    candidates.append(relaxed[op].format(left, right))
+
+        # Linear relations between variables that all step by a constant each iteration
+        steps = self._constant_steps()
+        stepping = [var for var in steps if var in constants]
+        for i, u in enumerate(stepping):
+            for v in stepping[i + 1:]:
+                candidates.append(f"{self._scaled(steps[v], u, constants[u])} == {self._scaled(steps[u], v, constants[v])}")
+
+        # Orderings between state variables
+        if len(program.scalars) <= MAX_PAIRWISE_VARIABLES:
+            for i, u in enumerate(program.scalars):
+                for v in program.scalars[i + 1:]:
+                    candidates.extend((f"{u} <= {v}", f"{u} >= {v}"))
+
+        # Assertions after the loop that only read the loop state
+        if all(stmt.type == "Assert" for stmt in program.suffix_statements):
+            candidates.extend(stmt.condition for stmt in program.suffix_statements)
+
+        usable = []
+        for candidate in candidates:
+            if candidate in usable:
+                continue
+            try:
+                tokenize(candidate)
+            except ValueError:
+                continue
+            if expression_variables(candidate) <= set(program.scalars):
+                usable.append(candidate)
+        return usable
+
+    def _scaled(self, factor, var, start):
+        """factor * (var - start), written as simply as the numbers allow."""
+        offset = var if start == 0 else f"({var} - {start})"
+        return offset if factor == 1 else f"{factor} * {offset}"
+
+    def _constant_steps(self):
+        """Variables the loop body changes exactly once, unconditionally, by v := v +/- c."""
+        assigned = {}
+        for stmt in self.program.body:
+            if stmt.type == "If":
+                for var in SSAConverter().modified_variables([stmt]):
+                    assigned[var] = None
+            elif stmt.type == "Assign":
+                match = re.fullmatch(rf'\s*{re.escape(stmt.variable)}\s*([+-])\s*(\d+)\s*', stmt.expression)
+                step = int(match.group(2)) * (1 if match.group(1) == "+" else -1) if match else None
+                assigned[stmt.variable] = step if stmt.variable not in assigned else None
+        return {var: step for var, step in assigned.items() if step}
+
+    def infer_invariants(self):
+        """
+        Houdini-style filtering: drop candidates the initial state violates, then
+        repeatedly drop candidates one loop iteration can break while assuming all
+        the remaining ones, until the rest is inductive.
+        """
+        candidates = self.candidate_invariants()
+        candidates = self._filter_candidates(candidates, consecution=False)
+        return self._filter_candidates(candidates, consecution=True)
+
+    def _filter_candidates(self, candidates, consecution):
+        program = self.program
+        while candidates:
+            generator = SMTGenerator()
+            if consecution:
+                self._instantiate(generator, program.step, "_h0")
+                self._link(generator, program.step.finals, "_h0", "_h1")
+                hypotheses = [self._translate_state(generator, c, "_h0") for c in candidates] + ["while_cond_h0"]
+            else:
+                self._instantiate(generator, program.prefix, "_p")
+                self._link(generator, program.prefix.finals, "_p", "_h1")
+                hypotheses = []
+            names = []
+            for j, candidate in enumerate(candidates):
+                name = f"inv_{j}"
+                names.append(name)
+                generator.declarations.append(f"(declare-fun {name} () Bool)")
+                generator.assertions.append(f"(assert (= {name} {self._translate_state(generator, candidate, '_h1')}))")
+            generator.assertions.append(f"(assert {conjunction(hypotheses + [f'(not {conjunction(names)})'])})")
+            script = generator.script(["(check-sat)", f"(get-value ({' '.join(names)}))", "(exit)"])
+
+            answers = solver_answers(self.solve(script))
+            status = answers[0][0] if answers else "unknown"
+            if status == "unsat":
+                return candidates
+            if status != "sat":
+                return []
+            values = model_values(answers[0][1])
+            survivors = [c for name, c in zip(names, candidates) if values.get(name) == "true"]
+            if len(survivors) == len(candidates):
+                return []
+            candidates = survivors
+        return []
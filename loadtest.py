@@ -0,0 +1,315 @@
+"""
+End-to-end load test for the Flask app.
+
+Starts the app in this process (or targets --url), replays a mix of programs
+from the README, input.txt and a seeded generator, and reports throughput
+and p50/p95/p99 latency for the whole request and for every stage listed in
+the Server-Timing header. By default the solver is stub_solver.py, so the
+test runs anywhere without Z3:
+
+    python loadtest.py --concurrency 8 --duration 30
+    python loadtest.py --rate 20 --requests 500 --stub-latency 0.2
+    python loadtest.py --solver z3 --z3-path /usr/bin/z3 --mix readme=1,generated=3
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import random
+import re
+import shutil
+import sys
+import textwrap
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# --- program mixes -----------------------------------------------------------
+
+def readme_programs(path=os.path.join(HERE, "README.md")):
+    """The verification and comparison examples of the README."""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    verification = text.split("### Verification Mode Examples", 1)[1].split("### Comparison Mode Examples", 1)
+    comparison = verification[1].split("## Project Structure", 1)[0]
+    programs = [{"mode": "verify", "code1": code} for code in code_blocks(verification[0])]
+    blocks = code_blocks(comparison)
+    programs += [{"mode": "equivalence", "code1": first, "code2": second} for first, second in zip(blocks[::2], blocks[1::2])]
+    return programs
+
+
+def code_blocks(text):
+    return [textwrap.dedent(block).strip() for block in re.findall(r'^ *```plaintext\n(.*?)^ *```', text, flags=re.MULTILINE | re.DOTALL)]
+
+
+def input_file_programs(path=os.path.join(HERE, "input.txt")):
+    """The samples of input.txt: single programs for verification, ===Program 1/2=== pairs for equivalence."""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    verification, _, equivalence = text.partition("Equivalence Mode:")
+    programs = []
+    for sample in re.split(r'^Sample \w+ \d+:\s*$', verification, flags=re.MULTILINE)[1:]:
+        programs.append({"mode": "verify", "code1": sample.strip()})
+    for sample in re.split(r'^Sample \w+ \d+:\s*$', equivalence, flags=re.MULTILINE)[1:]:
+        parts = re.split(r'^===Program \d===\s*$', sample, flags=re.MULTILINE)
+        if len(parts) == 3:
+            programs.append({"mode": "equivalence", "code1": parts[1].strip(), "code2": parts[2].strip()})
+    return programs
+
+
+def generated_program(rng):
+    """A random counter loop with a branch, written one statement per line like the samples."""
+    variables = ["x", "y", "z"][:rng.randint(1, 3)]
+    bound = rng.randint(2, 8)
+    lines = [f"{var}:={rng.randint(0, 5)};" for var in variables] + ["i:=0;", f"while(i < {bound}) {{", "    i:=i+1;"]
+    var, other = rng.choice(variables), rng.choice(variables)
+    lines += [f"    if (i < {rng.randint(1, bound)}) {{", f"        {var}:={var}+{rng.randint(1, 3)};", "    } else {",
+              f"        {other}:={other}-{rng.randint(1, 3)};", "    }", "}", f"assert({var} >= {rng.randint(0, 10)})"]
+    return {"mode": "verify", "code1": "\n".join(lines)}
+
+
+class ProgramMix:
+    """Draws form submissions from the weighted sources, reproducibly for a given seed."""
+
+    def __init__(self, weights, depth=3, seed=0):
+        self.rng = random.Random(seed)
+        self.depth = depth
+        self.sources = []
+        for name, weight in weights.items():
+            if name == "readme":
+                self.sources.append((weight, readme_programs()))
+            elif name == "input":
+                self.sources.append((weight, input_file_programs()))
+            elif name == "generated":
+                self.sources.append((weight, None))
+            else:
+                raise ValueError(f"Unknown program source: {name}")
+        self.lock = threading.Lock()
+
+    def next(self):
+        with self.lock:
+            _, programs = self.rng.choices(self.sources, weights=[weight for weight, _ in self.sources])[0]
+            form = dict(self.rng.choice(programs)) if programs else generated_program(self.rng)
+        form.setdefault("code2", "")
+        form["depth"] = str(self.depth)
+        return form
+
+
+# --- running -----------------------------------------------------------------
+
+def server_timing(header):
+    """Parse 'name;dur=12.3, other;dur=4' into {name: seconds}."""
+    stages = {}
+    for entry in (header or "").split(","):
+        match = re.match(r'\s*([\w-]+).*?dur=([\d.]+)', entry)
+        if match:
+            stages[match.group(1)] = float(match.group(2)) / 1000
+    return stages
+
+
+def submit(url, form, timeout):
+    """POST one analysis; returns (latency seconds, HTTP status, Server-Timing stages, analysis error or None)."""
+    data = urllib.parse.urlencode(form).encode("utf-8")
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data), timeout=timeout) as response:
+            body = response.read().decode("utf-8", errors="replace")
+            status, header = response.status, response.headers.get("Server-Timing")
+    except urllib.error.HTTPError as e:
+        return time.perf_counter() - started, e.code, {}, f"HTTP {e.code}"
+    except (urllib.error.URLError, OSError) as e:
+        return time.perf_counter() - started, 0, {}, str(e)
+    latency = time.perf_counter() - started
+    error = re.search(r'alert-danger[^>]*>\s*(.*?)\s*<', body, flags=re.DOTALL)
+    return latency, status, server_timing(header), error.group(1) if error else None
+
+
+class LoadTest:
+    """
+    Closed loop (concurrency workers that each send the next request as soon
+    as the previous one returns) or, with a rate, open loop: Poisson arrivals
+    at rate requests per second, served by at most concurrency requests in flight.
+    """
+
+    def __init__(self, url, mix, concurrency=4, rate=None, duration=None, requests=None, timeout=120):
+        self.url = url
+        self.mix = mix
+        self.concurrency = concurrency
+        self.rate = rate
+        self.duration = duration
+        self.requests = requests
+        self.timeout = timeout
+        self.samples = []
+        self.lock = threading.Lock()
+
+    def _record(self, sample):
+        with self.lock:
+            self.samples.append(sample)
+
+    def _budget_left(self, issued, started):
+        if self.requests is not None and issued >= self.requests:
+            return False
+        return self.duration is None or time.perf_counter() - started < self.duration
+
+    def run(self):
+        started = time.perf_counter()
+        issued = [0]
+        issue_lock = threading.Lock()
+        jobs = queue.Queue() if self.rate else None
+
+        def take():
+            with issue_lock:
+                if not self._budget_left(issued[0], started):
+                    return False
+                issued[0] += 1
+                return True
+
+        def worker():
+            while True:
+                if jobs is not None:
+                    arrival = jobs.get()
+                    if arrival is None:
+                        return
+                elif not take():
+                    return
+                form = self.mix.next()
+                latency, status, stages, error = submit(self.url, form, self.timeout)
+                if jobs is not None:
+                    # Open loop: latency runs from the scheduled arrival, including the wait for a free worker
+                    latency = time.perf_counter() - arrival
+                self._record({"mode": form["mode"], "latency": latency, "status": status, "stages": stages, "error": error})
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        if jobs is not None:
+            rng = random.Random(1)
+            next_arrival = time.perf_counter()
+            while take():
+                next_arrival += rng.expovariate(self.rate)
+                time.sleep(max(0.0, next_arrival - time.perf_counter()))
+                jobs.put(next_arrival)
+            for _ in threads:
+                jobs.put(None)
+        for thread in threads:
+            thread.join()
+        return self.report(time.perf_counter() - started)
+
+    def report(self, elapsed):
+        completed = [s for s in self.samples if s["status"] == 200]
+        stages = {}
+        for sample in completed:
+            for name, seconds in sample["stages"].items():
+                stages.setdefault(name, []).append(seconds)
+        modes = {}
+        for sample in completed:
+            modes.setdefault(sample["mode"], []).append(sample["latency"])
+        return {
+            "requests": len(self.samples),
+            "completed": len(completed),
+            "failed": len(self.samples) - len(completed),
+            "analysis_errors": sum(1 for s in completed if s["error"]),
+            "elapsed": elapsed,
+            "throughput": len(completed) / elapsed if elapsed else 0.0,
+            "latency": percentiles([s["latency"] for s in completed]),
+            "modes": {mode: percentiles(values) for mode, values in modes.items()},
+            "stages": {name: percentiles(values) for name, values in stages.items()},
+            "errors": sorted({s["error"] for s in self.samples if s["error"]})[:10],
+        }
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))]
+
+    return {"count": len(ordered), "p50": rank(50), "p95": rank(95), "p99": rank(99), "max": ordered[-1]}
+
+
+def format_report(report):
+    lines = [f"{report['completed']}/{report['requests']} requests completed in {report['elapsed']:.1f}s "
+             f"({report['throughput']:.2f} req/s), {report['failed']} failed, {report['analysis_errors']} analysis errors",
+             "", f"{'':12}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+    rows = [("request", report["latency"])] + [(f"  {mode}", values) for mode, values in report["modes"].items()]
+    rows += [(f"stage {name}", values) for name, values in report["stages"].items()]
+    for name, values in rows:
+        if values:
+            lines.append(f"{name:12}{values['count']:>7}" + "".join(f"{values[key] * 1000:>10.1f}" for key in ("p50", "p95", "p99", "max")))
+    if report["errors"]:
+        lines += ["", "Errors:"] + [f"  {error}" for error in report["errors"]]
+    return "\n".join(lines)
+
+
+# --- local server ------------------------------------------------------------
+
+def start_local_app(solver, z3_path=None):
+    """Import the app with the chosen solver and serve it on a free local port; returns its URL."""
+    if solver == "stub":
+        os.environ["FM_Z3_PATH"] = os.path.join(HERE, "stub_solver.py")
+    else:
+        os.environ["FM_Z3_PATH"] = z3_path or shutil.which("z3") or "z3"
+    sys.path.insert(0, HERE)
+    import app as application
+    from werkzeug.serving import make_server
+
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    # Load-test solves must not train the cost model or the portfolio ordering
+    application.solve_scheduler.model.path = None
+    application.solve_scheduler.model.log_path = None
+    application.solver_portfolio.stats.path = None
+    server = make_server("127.0.0.1", 0, application.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/"
+
+
+def parse_mix(text):
+    weights = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the Formal Methods Playground over HTTP.")
+    parser.add_argument("--url", help="target a running server instead of starting one")
+    parser.add_argument("--solver", choices=("stub", "z3"), default="stub")
+    parser.add_argument("--z3-path", help="z3 binary for --solver z3 (default: z3 on PATH)")
+    parser.add_argument("--stub-latency", type=float, default=0.05, help="seconds per stub solver run")
+    parser.add_argument("--stub-answer", default="unsat", choices=("sat", "unsat", "unknown", "hash"))
+    parser.add_argument("--mix", default="readme=1,input=1,generated=2", help="weighted program sources")
+    parser.add_argument("--depth", type=int, default=3, help="unroll depth sent with every request")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, help="open-loop arrival rate in requests per second")
+    parser.add_argument("--duration", type=float, help="seconds to run (default 10 when --requests is not given)")
+    parser.add_argument("--requests", type=int, help="number of requests to send")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    os.environ["FM_STUB_LATENCY"] = str(args.stub_latency)
+    os.environ["FM_STUB_ANSWER"] = args.stub_answer
+    url = args.url or start_local_app(args.solver, args.z3_path)
+    duration = args.duration if args.duration is not None or args.requests is not None else 10.0
+    test = LoadTest(url, ProgramMix(parse_mix(args.mix), args.depth, args.seed), args.concurrency,
+                    args.rate, duration, args.requests)
+    report = test.run()
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["completed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
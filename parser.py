@@ -1,7 +1,9 @@
+import logging
 import os
 import re
 import graphviz
 import uuid
+from governance import Cancelled
 
 class Node:
     def __init__(self, node_type, **kwargs):
@@ -25,30 +27,32 @@ class Node:
         return result
 
 class Parser:
-    def __init__(self):
+    def __init__(self, guard=None):
         self.lines = []
         self.index = 0
+        self.guard = guard
 
     def _preprocess_lines(self, code):
         """Preprocess the code to handle multi-line constructs and else clauses."""
-        raw_lines = [line.strip() for line in code.split('\n') if line.strip()]
+        raw_lines = []
+        for line in code.split('\n'):
+            line = line.strip()
+            if not line:
+                continue
+            # Handle else clauses, at any nesting level
+            match = re.search(r'(.*?)}\s*(else\s*\{?)', line) if '}' in line and 'else' in line else None
+            if match:
+                before = match.group(1).strip()
+                if before:
+                    raw_lines.append(before)
+                raw_lines.append('}')
+                raw_lines.append(match.group(2).strip())
+            else:
+                raw_lines.append(line)
         processed_lines = []
         i = 0
         while i < len(raw_lines):
             line = raw_lines[i]
-            # Handle else clauses
-            if '}' in line and 'else' in line:
-                match = re.search(r'(.*?)}\s*(else\s*\{?)', line)
-                if match:
-                    before = match.group(1).strip()
-                    closing = '}'
-                    after = match.group(2).strip()
-                    if before:
-                        processed_lines.append(before)
-                    processed_lines.append(closing)
-                    processed_lines.append(after)
-                    i += 1
-                    continue
             # Handle block start (if, while, for)
             if re.match(r"(if|while|for)\s*\(.+\)\s*\{", line):
                 processed_lines.append(line)
@@ -75,6 +79,8 @@ class Parser:
     def parse_block(self):
         block = []
         while self.index < len(self.lines):
+            if self.guard:
+                self.guard.check()
             line = self.lines[self.index].strip()
 
             if not line:
@@ -151,8 +157,8 @@ class Parser:
             if 'forall' in condition:
                 raise ValueError("Forall assertions are not supported. Use a loop-based assertion instead.")
             return Node("Assert", condition=condition)
-        elif re.match(r"[\w\[\]]+\s*:=\s*.+;", line):
-            match = re.match(r"([\w\[\]]+)\s*:=\s*(.+);", line)
+        elif re.match(r"\w+(\[[^\]]+\])?\s*:=\s*.+;", line):
+            match = re.match(r"(\w+(?:\[[^\]]+\])?)\s*:=\s*(.+);", line)
             if not match:
                 raise ValueError(f"Invalid assignment statement at line {self.index}: {line}")
             variable = match.group(1).strip()
@@ -205,11 +211,15 @@ class Parser:
         return dot
 
     def save_ast_graph(self, ast, output_path=None):
-        """Save the AST graph as a PNG and return the file path."""
+        """Save the AST graph as a PNG and return the file path, or "" when Graphviz is not installed."""
         dot = self.generate_dot(ast)
         if output_path is None:
             output_path = f"static/ast_{uuid.uuid4().hex}"
-        dot.render(filename=output_path, format='png', cleanup=True)
+        try:
+            dot.render(filename=output_path, format='png', cleanup=True)
+        except graphviz.ExecutableNotFound:
+            logging.warning("Graphviz 'dot' not found; the AST graph is not rendered")
+            return ""
         return f"{output_path}.png"
 
     def parse_program(self, code):
@@ -218,10 +228,12 @@ class Parser:
         Returns a tuple (AST dict, PNG file path, AST Node) or an error message.
         """
         try:
-            self.__init__()  # Reinitialize parser state
+            self.__init__(self.guard)  # Reinitialize parser state
             self.lines = self._preprocess_lines(code)
             ast = self.parse()
             png_path = self.save_ast_graph(ast)
             return ast.to_dict(), png_path, ast
+        except Cancelled:
+            raise
         except Exception as e:
             return f"Parsing error: {str(e)}"
\ No newline at end of file
@@ -0,0 +1,124 @@
+"""
+Compare the two phi placements of the SSA converter on the sample programs.
+
+Every README and input.txt sample is converted with the original structured
+placement and with minimal placement (dominance frontiers, pruned by
+liveness), encoded, and solved with Z3. The report lists phi and SMT
+assertion counts, the median solve time of --repeat runs, and flags any
+program whose verdict differs between the two:
+
+    python phi_report.py
+    python phi_report.py --depth 8 --repeat 5 --z3-path /usr/bin/z3
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+from loadtest import input_file_programs, readme_programs
+from parser import Parser
+from smt_generator import SMTGenerator
+from ssa_converter import PHI_PLACEMENTS, SSAConverter
+
+
+def parse(code):
+    parser = Parser()
+    parser.lines = parser._preprocess_lines(code)
+    return parser.parse()
+
+
+def encode(program, depth, placement):
+    """(SSA instructions of every program, SMT script) for one sample."""
+    live_out = SMTGenerator.verification_outputs() if program["mode"] == "verify" else None
+    ssa = [SSAConverter(phi_placement=placement).convert(parse(program[key]), unroll_depth=depth, live_out=live_out)
+           for key in ("code1", "code2") if program.get(key)]
+    if program["mode"] == "verify":
+        return ssa, SMTGenerator().generate_smt(ssa[0])
+    return ssa, SMTGenerator().generate_smt(ssa[0], mode="comparison", ssa_instructions2=ssa[1])
+
+
+def solve(z3_path, smt_code, repeat, timeout):
+    """(verdict, median seconds) over repeat runs of z3."""
+    times = []
+    verdict = "unknown"
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = subprocess.run([z3_path, "-in", f"-T:{timeout}"], input=smt_code, capture_output=True, text=True).stdout
+        times.append(time.perf_counter() - started)
+        verdict = output.strip().split("\n")[0] if output.strip() else "error"
+    return verdict, statistics.median(times)
+
+
+def measure(programs, depth, z3_path, repeat=3, timeout=30):
+    rows = []
+    for name, program in programs:
+        row = {"program": name, "mode": program["mode"]}
+        for placement in PHI_PLACEMENTS:
+            try:
+                ssa, smt_code = encode(program, depth, placement)
+            except Exception as e:
+                row[placement] = {"error": str(e)}
+                continue
+            verdict, seconds = solve(z3_path, smt_code, repeat, timeout)
+            row[placement] = {
+                "phis": sum(1 for instructions in ssa for instr in instructions if instr.expression.startswith("φ(")),
+                "asserts": smt_code.count("(assert "),
+                "seconds": seconds,
+                "verdict": verdict,
+            }
+        rows.append(row)
+    return rows
+
+
+def format_report(rows, depth):
+    lines = [f"Unroll depth {depth}; 'structured' -> 'minimal'", "",
+             f"{'program':18}{'phis':>12}{'asserts':>14}{'solve ms':>18}  verdict"]
+    totals = {placement: {"phis": 0, "asserts": 0, "seconds": 0.0} for placement in PHI_PLACEMENTS}
+    for row in rows:
+        old, new = row["structured"], row["minimal"]
+        if "error" in old or "error" in new:
+            lines.append(f"{row['program']:18}  error: {old.get('error') or new.get('error')}")
+            continue
+        for placement in PHI_PLACEMENTS:
+            for key in totals[placement]:
+                totals[placement][key] += row[placement][key]
+        verdict = old["verdict"] if old["verdict"] == new["verdict"] else f"MISMATCH {old['verdict']} -> {new['verdict']}"
+        lines.append(f"{row['program']:18}{old['phis']:>5} -> {new['phis']:<4}{old['asserts']:>6} -> {new['asserts']:<5}"
+                     f"{old['seconds'] * 1000:>8.1f} -> {new['seconds'] * 1000:<7.1f}  {verdict}")
+    old, new = totals["structured"], totals["minimal"]
+
+    def change(key):
+        return f"{100 * (new[key] / old[key] - 1):+.0f}%" if old[key] else "-"
+
+    lines += ["", f"Total phis {old['phis']} -> {new['phis']} ({change('phis')}), "
+                  f"asserts {old['asserts']} -> {new['asserts']} ({change('asserts')}), "
+                  f"solve time {old['seconds'] * 1000:.1f} -> {new['seconds'] * 1000:.1f} ms ({change('seconds')})"]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report phi counts and solve times for both phi placements.")
+    parser.add_argument("--depth", type=int, default=5, help="unroll depth for every sample")
+    parser.add_argument("--repeat", type=int, default=3, help="z3 runs per query; the median time is reported")
+    parser.add_argument("--timeout", type=int, default=30, help="z3 timeout in seconds")
+    parser.add_argument("--z3-path", help="z3 binary (default: FM_Z3_PATH, then z3 on PATH)")
+    parser.add_argument("--json", help="also write the measurements to this file")
+    args = parser.parse_args(argv)
+
+    z3_path = args.z3_path or os.environ.get("FM_Z3_PATH") or shutil.which("z3") or "z3"
+    programs = [(f"readme {i}", program) for i, program in enumerate(readme_programs(), 1)]
+    programs += [(f"input.txt {i}", program) for i, program in enumerate(input_file_programs(), 1)]
+    rows = measure(programs, args.depth, z3_path, args.repeat, args.timeout)
+    print(format_report(rows, args.depth))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+    return 0 if all(row["structured"].get("verdict") == row["minimal"].get("verdict") for row in rows) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+import json
+import logging
+import os
+import queue
+import re
+import subprocess
+import threading
+import time
+from governance import Cancelled
+
+# Each configuration is a variation of the same query: extra Z3 command-line
+# parameters, a replacement logic for (set-logic ...) and/or a tactic used in
+# place of the plain (check-sat).
+DEFAULT_CONFIGS = [
+    {"name": "default"},
+    {"name": "seed-1", "options": ["smt.random_seed=1", "sat.random_seed=1"]},
+    {"name": "seed-2", "options": ["smt.random_seed=2", "sat.random_seed=2"]},
+    {"name": "arith-simplex", "options": ["smt.arith.solver=2"]},
+    {"name": "arith-new", "options": ["smt.arith.solver=6"]},
+    {"name": "logic-qf-lia", "logic": "QF_LIA"},
+    {"name": "logic-qf-auflia", "logic": "QF_AUFLIA"},
+    {"name": "tactic-solve-eqs", "tactic": "(then simplify solve-eqs smt)"},
+]
+
+DEFINITIVE = ("sat", "unsat")
+
+
+def first_status(output):
+    """Return the first sat/unsat/unknown line of a Z3 output, or None."""
+    for line in output.split('\n'):
+        line = line.strip()
+        if line in ("sat", "unsat", "unknown"):
+            return line
+    return None
+
+
+class PortfolioStats:
+    """Per-configuration run/win counters, persisted as JSON between runs."""
+
+    def __init__(self, path="portfolio_stats.json"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.stats = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.stats = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring unreadable portfolio stats {path}: {e}")
+
+    def record(self, names, winner=None, elapsed=None):
+        with self.lock:
+            for name in names:
+                entry = self.stats.setdefault(name, {"runs": 0, "wins": 0, "win_time": 0.0})
+                entry["runs"] += 1
+                if name == winner:
+                    entry["wins"] += 1
+                    entry["win_time"] += elapsed or 0.0
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, "w") as f:
+                json.dump(self.stats, f, indent=2)
+        except OSError as e:
+            logging.warning(f"Could not save portfolio stats to {self.path}: {e}")
+
+    def order(self, configs):
+        """Sort configs by win rate, then mean winning time; unseen configs keep their place."""
+        def key(item):
+            index, config = item
+            entry = self.stats.get(config["name"])
+            if not entry or not entry["runs"]:
+                return (0.0, 0.0, index)
+            rate = entry["wins"] / entry["runs"]
+            mean = entry["win_time"] / entry["wins"] if entry["wins"] else float("inf")
+            return (-rate, mean, index)
+
+        with self.lock:
+            return [config for _, config in sorted(enumerate(configs), key=key)]
+
+
+class SolverPortfolio:
+    """
+    Run several Z3 configurations of the same SMT query in parallel and return
+    the first definitive (sat/unsat) answer, killing the remaining processes.
+    """
+
+    def __init__(self, z3_path, configs=None, stats=None, max_workers=None, timeout=10):
+        self.z3_path = z3_path
+        self.configs = configs or DEFAULT_CONFIGS
+        self.stats = stats if stats is not None else PortfolioStats()
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+
+    def applicable_configs(self, smt_code):
+        uses_arrays = "(Array " in smt_code
+        uses_quantifiers = "(forall " in smt_code or "(exists " in smt_code
+        configs = []
+        for config in self.configs:
+            logic = config.get("logic")
+            if logic and logic.startswith("QF_") and uses_quantifiers:
+                continue
+            if logic and uses_arrays and not logic.replace("QF_", "", 1).startswith("A"):
+                continue
+            configs.append(config)
+        return configs
+
+    def build_query(self, smt_code, config):
+        if config.get("logic"):
+            smt_code = re.sub(r'\(set-logic [^)]*\)', f"(set-logic {config['logic']})", smt_code, count=1)
+        if config.get("tactic"):
+            smt_code = smt_code.replace("(check-sat)", f"(check-sat-using {config['tactic']})")
+        return smt_code
+
+    def build_command(self, config, timeout, memory_mb=None):
+        command = [self.z3_path, "-in", f"-T:{timeout}"]
+        if memory_mb:
+            command.append(f"-memory:{memory_mb}")
+        return command + list(config.get("options", []))
+
+    def fan_out(self, smt_code):
+        """Most Z3 processes solve() runs at once on the query."""
+        return min(self.max_workers, len(self.applicable_configs(smt_code)))
+
+    def solve(self, smt_code, guard=None, max_workers=None):
+        """
+        Returns a tuple (raw output, winning config name, elapsed seconds). If no
+        configuration gives a definitive answer, the first output received is
+        returned with a winner of None. A guard, when given, supplies the solver
+        time/memory budget and cancels every running configuration; max_workers
+        lowers the number of configurations run at once.
+        """
+        workers = min(max_workers or self.max_workers, self.max_workers)
+        timeout = self.timeout
+        memory_mb = None
+        if guard:
+            timeout = max(1, min(guard.budget.solver_timeout, int(guard.remaining())))
+            memory_mb = guard.budget.solver_memory_mb
+        configs = self.stats.order(self.applicable_configs(smt_code))
+        pending = list(configs)
+        running = {}
+        results = queue.Queue()
+        started = time.monotonic()
+        fallback = None
+        winner = None
+
+        def launch(config):
+            process = subprocess.Popen(self.build_command(config, timeout, memory_mb), stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+            if guard:
+                guard.budget.limit_solver(process)
+            running[config["name"]] = process
+
+            def wait():
+                try:
+                    output, _ = process.communicate(self.build_query(smt_code, config))
+                except Exception as e:
+                    output = f"(error \"{e}\")"
+                results.put((config["name"], output))
+
+            threading.Thread(target=wait, daemon=True).start()
+
+        try:
+            while pending and len(running) < workers:
+                launch(pending.pop(0))
+
+            deadline = started + timeout + 5
+            while running:
+                try:
+                    name, output = results.get(timeout=0.1)
+                except queue.Empty:
+                    if guard and guard.cancelled:
+                        raise Cancelled(guard.reason)
+                    if time.monotonic() > deadline:
+                        break
+                    continue
+                running.pop(name, None)
+                status = first_status(output)
+                logging.debug(f"Portfolio config {name} finished with {status}")
+                if status in DEFINITIVE:
+                    winner = (name, output)
+                    break
+                if fallback is None:
+                    fallback = output
+                if pending:
+                    launch(pending.pop(0))
+        finally:
+            for process in running.values():
+                if process.poll() is None:
+                    process.kill()
+
+        elapsed = time.monotonic() - started
+        names = [config["name"] for config in configs if config not in pending]
+        if winner:
+            self.stats.record(names, winner[0], elapsed)
+            return winner[1], winner[0], elapsed
+        self.stats.record(names)
+        return fallback or "", None, elapsed
@@ -0,0 +1,193 @@
+import cProfile
+import hmac
+import io
+import logging
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+from artifacts import Artifact
+
+# Only one request can be profiled at a time: cProfile and tracemalloc are process-wide
+_profile_lock = threading.Lock()
+
+
+def profiling_token():
+    return os.environ.get("FM_PROFILE_TOKEN", "")
+
+
+def profiling_requested(request):
+    """
+    True when the request carries the admin profiling token, either in the
+    X-FM-Profile header or in a "profile" form/query field. Profiling is off
+    unless FM_PROFILE_TOKEN is set.
+    """
+    token = profiling_token()
+    if not token:
+        return False
+    supplied = request.headers.get("X-FM-Profile") or request.values.get("profile") or ""
+    return hmac.compare_digest(supplied.encode("utf-8"), token.encode("utf-8"))
+
+
+class StageTimer:
+    """
+    Wall-clock time per pipeline stage of one request, summed when a stage
+    runs more than once (e.g. parsing both programs), and rendered as a
+    Server-Timing header so browsers and load tests can see where the time went.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def header(self):
+        durations = dict(self.durations, total=time.perf_counter() - self.started)
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in durations.items())
+
+
+class StackSampler:
+    """
+    Samples the call stack of one thread every interval seconds and counts
+    identical stacks, which is the collapsed format read by flamegraph.pl
+    and speedscope ("outer;inner;leaf count").
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+class RequestProfiler:
+    """
+    Profiles the handling of one request: cProfile for exact call counts and
+    cumulative times, a stack sampler for a flamegraph, and tracemalloc for
+    the lines that allocated the most memory (deep unrolls). The results are
+    turned into downloadable artifacts with artifacts().
+    """
+
+    ARTIFACTS = {
+        "profile": ("profile.txt", "text/plain; charset=utf-8"),
+        "pstats": ("profile.pstats", "application/octet-stream"),
+        "collapsed": ("profile.collapsed", "text/plain; charset=utf-8"),
+        "allocations": ("allocations.txt", "text/plain; charset=utf-8"),
+    }
+
+    def __init__(self, sample_interval=0.005, top_allocations=30, traceback_depth=10):
+        self.sample_interval = sample_interval
+        self.top_allocations = top_allocations
+        self.traceback_depth = traceback_depth
+        self.profiler = None
+        self.sampler = None
+        self.snapshot = None
+        self.peak_memory = 0
+        self.elapsed = 0.0
+        self.active = False
+
+    def start(self):
+        """Start profiling the calling thread; returns False if another request is being profiled."""
+        if not _profile_lock.acquire(blocking=False):
+            logging.warning("Profiling skipped: another profiled request is running")
+            return False
+        self.active = True
+        self._started = time.perf_counter()
+        tracemalloc.start(self.traceback_depth)
+        self.sampler = StackSampler(threading.get_ident(), self.sample_interval)
+        self.sampler.start()
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+        return True
+
+    def stop(self):
+        if not self.active:
+            return
+        try:
+            self.profiler.disable()
+            self.sampler.stop()
+            self.snapshot = tracemalloc.take_snapshot()
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.elapsed = time.perf_counter() - self._started
+        finally:
+            self.active = False
+            _profile_lock.release()
+
+    def report(self, limit=40):
+        stream = io.StringIO()
+        stream.write(f"Wall time: {self.elapsed:.3f}s, {self.sampler.samples} stack samples, "
+                     f"peak traced memory: {self.peak_memory / 1024 / 1024:.1f} MiB\n\n")
+        stats = pstats.Stats(self.profiler, stream=stream)
+        stats.strip_dirs().sort_stats("cumulative").print_stats(limit)
+        stats.sort_stats("tottime").print_stats(limit)
+        return stream.getvalue()
+
+    def allocations(self):
+        snapshot = self.snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        lines = [f"Peak traced memory: {self.peak_memory / 1024 / 1024:.1f} MiB",
+                 f"Top {self.top_allocations} allocation sites still alive at the end of the request:", ""]
+        for rank, stat in enumerate(snapshot.statistics("traceback")[:self.top_allocations], 1):
+            lines.append(f"#{rank}: {stat.size / 1024:.1f} KiB in {stat.count} blocks")
+            lines.extend(f"    {line}" for line in stat.traceback.format(most_recent_first=True))
+        return "\n".join(lines)
+
+    def downloads(self):
+        """(artifact name, file name) pairs for the download links."""
+        return [(name, filename) for name, (filename, _) in self.ARTIFACTS.items()]
+
+    def artifacts(self):
+        """Artifact per name in ARTIFACTS, served with a download file name."""
+        stats = pstats.Stats(self.profiler)
+        contents = {
+            "profile": self.report(),
+            "pstats": marshal.dumps(stats.stats),
+            "collapsed": self.sampler.collapsed(),
+            "allocations": self.allocations(),
+        }
+        return {name: Artifact(contents[name], content_type, filename=filename)
+                for name, (filename, content_type) in self.ARTIFACTS.items()}
@@ -0,0 +1,176 @@
+import itertools
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+FEATURES = ("instructions", "phis", "stores", "depth", "quantifiers")
+
+# log(seconds) = intercept + sum(weight * log1p(feature)); quantifiers count as 0/1
+DEFAULT_WEIGHTS = {"intercept": -6.0, "instructions": 0.6, "phis": 0.2, "stores": 0.4, "depth": 0.2, "quantifiers": 2.0}
+
+# Answers of a solve that ran to completion; anything else (errors, kills) is not a measurement
+RECORDED_STATUSES = ("sat", "unsat", "unknown")
+
+
+def query_features(ssa_instructions, unroll_depth, smt_code=""):
+    """Cheap size features of a query, available right after SSA conversion (all programs of the query together)."""
+    phis = sum(1 for instr in ssa_instructions if instr.expression.startswith("φ("))
+    stores = sum(instr.expression.count("(store ") for instr in ssa_instructions)
+    return {
+        "instructions": len(ssa_instructions),
+        "phis": phis,
+        "stores": stores,
+        "depth": unroll_depth,
+        "quantifiers": int("(forall " in smt_code or "(exists " in smt_code),
+    }
+
+
+class CostModel:
+    """
+    Log-linear estimate of the solve time of a query. Every observed solve
+    nudges the weights towards the measured time (normalized least mean
+    squares on the log scale); the weights are saved as JSON and every
+    observation is appended to a JSON-lines log for offline recalibration.
+    """
+
+    def __init__(self, path="cost_model.json", log_path="solve_times.jsonl", learning_rate=0.1):
+        self.path = path
+        self.log_path = log_path
+        self.learning_rate = learning_rate
+        self.lock = threading.Lock()
+        self.weights = dict(DEFAULT_WEIGHTS)
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.weights.update(json.load(f))
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring unreadable cost model {path}: {e}")
+
+    def _inputs(self, features):
+        inputs = {"intercept": 1.0}
+        for name in FEATURES:
+            inputs[name] = float(features[name]) if name == "quantifiers" else math.log1p(features[name])
+        return inputs
+
+    def predict(self, features):
+        inputs = self._inputs(features)
+        with self.lock:
+            return math.exp(sum(self.weights[name] * value for name, value in inputs.items()))
+
+    def record(self, features, predicted, actual, lane):
+        inputs = self._inputs(features)
+        error = math.log(max(actual, 1e-3)) - math.log(max(predicted, 1e-3))
+        norm = sum(value * value for value in inputs.values())
+        with self.lock:
+            for name, value in inputs.items():
+                self.weights[name] += self.learning_rate * error * value / norm
+            self._save({"features": features, "predicted": round(predicted, 4),
+                        "actual": round(actual, 4), "lane": lane, "time": time.time()})
+
+    def _save(self, observation):
+        try:
+            if self.log_path:
+                with open(self.log_path, "a") as f:
+                    f.write(json.dumps(observation) + "\n")
+            if self.path:
+                with open(self.path, "w") as f:
+                    json.dump(self.weights, f, indent=2)
+        except OSError as e:
+            logging.warning(f"Could not save cost model observation: {e}")
+
+
+class Lane:
+    """
+    A fixed number of solver slots with a waiting list. The next waiter is the
+    one with the smallest predicted cost after subtracting the time it has
+    already waited, so cheap queries go first but nothing waits forever.
+    """
+
+    def __init__(self, name, capacity, aging=1.0):
+        self.name = name
+        self.capacity = capacity
+        self.aging = aging
+        self.running = 0
+        self.waiting = {}
+        self.condition = threading.Condition()
+
+    def _next(self, now):
+        return min(self.waiting, key=lambda ticket: (self.waiting[ticket][0] - self.aging * (now - self.waiting[ticket][1]), ticket))
+
+    def acquire(self, ticket, predicted, guard=None, count=1):
+        with self.condition:
+            self.waiting[ticket] = (predicted, time.monotonic())
+            try:
+                while self.running + count > self.capacity or self._next(time.monotonic()) != ticket:
+                    if guard:
+                        guard.check()
+                    self.condition.wait(0.1)
+            finally:
+                del self.waiting[ticket]
+            self.running += count
+            self.condition.notify_all()
+
+    def release(self, count=1):
+        with self.condition:
+            self.running -= count
+            self.condition.notify_all()
+
+
+class SolverSlot:
+    """A solve's hold on its lane: how many solver processes it may run, and how it ended."""
+
+    def __init__(self, lane, workers):
+        self.lane = lane
+        self.workers = workers
+        self.status = None
+
+
+class SolverScheduler:
+    """
+    Admission control for the solving stage. Each query's cost is predicted
+    from query_features(); queries predicted below fast_threshold seconds use
+    the fast lane, the rest the slow lane, so small programs do not queue
+    behind large ones.
+    """
+
+    def __init__(self, model=None, fast_workers=2, slow_workers=2, fast_threshold=1.0):
+        self.model = model if model is not None else CostModel()
+        self.fast_threshold = fast_threshold
+        self.lanes = {"fast": Lane("fast", fast_workers), "slow": Lane("slow", slow_workers)}
+        self.tickets = itertools.count()
+
+    @classmethod
+    def from_env(cls):
+        return cls(fast_workers=int(os.environ.get("FM_FAST_WORKERS", 2)),
+                   slow_workers=int(os.environ.get("FM_SLOW_WORKERS", 2)),
+                   fast_threshold=float(os.environ.get("FM_FAST_LANE_SECONDS", 1.0)))
+
+    @contextmanager
+    def slot(self, features, guard=None, workers=1):
+        """
+        Wait for solver slots in the query's lane, one per solver process the
+        solve runs at once (workers, at most the lane's capacity). The caller
+        sets the status of the yielded SolverSlot; only solves that ended sat,
+        unsat or unknown are recorded against the prediction.
+        """
+        predicted = self.model.predict(features)
+        lane = self.lanes["fast" if predicted < self.fast_threshold else "slow"]
+        slot = SolverSlot(lane.name, max(1, min(workers, lane.capacity)))
+        queued = time.monotonic()
+        lane.acquire(next(self.tickets), predicted, guard, slot.workers)
+        started = time.monotonic()
+        logging.debug(f"Scheduled on {lane.name} lane with {slot.workers} slot(s): predicted {predicted:.3f}s, "
+                      f"waited {started - queued:.3f}s")
+        try:
+            yield slot
+        finally:
+            lane.release(slot.workers)
+        # Cancelled solves leave through the finally above and are not measurements
+        actual = time.monotonic() - started
+        logging.info(f"Solve on {lane.name} lane ended {slot.status} after {actual:.3f}s (predicted {predicted:.3f}s) for {features}")
+        if slot.status in RECORDED_STATUSES:
+            self.model.record(features, predicted, actual, lane.name)
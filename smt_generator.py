@@ -1,18 +1,177 @@
 import re
 from collections import defaultdict
 
+TOKEN_PATTERN = re.compile(r'\s*(\d+|[A-Za-z_]\w*|<=|>=|==|!=|&&|\|\||[-+*/%<>()!=])')
+CONDITION_TARGETS = ("while_cond", "for_cond")
+ARRAY_SORT = "(Array Int Int)"
+ARRAY_ACCESS = re.compile(r'\((?:select|store)\s+([A-Za-z_]\w*)_\d+\b')
+ARRAY_ENCODINGS = ("auto", "theory", "scalar")
+MAX_SCALAR_ARRAY = 16
+
+def model_value(value):
+    """Integer literal of a Z3 model value as the program would write it: (- 3) becomes -3."""
+    match = re.fullmatch(r'\(-\s+(\d+)\)', value.strip())
+    return f"-{match.group(1)}" if match else value
+
+
+def tokenize(expr):
+    tokens = []
+    pos = 0
+    expr = expr.rstrip()
+    while pos < len(expr):
+        match = TOKEN_PATTERN.match(expr, pos)
+        if not match:
+            raise ValueError(f"Unexpected character '{expr[pos:].strip()[0]}' in expression: {expr}")
+        tokens.append(match.group(1))
+        pos = match.end()
+    return tokens
+
+class ExpressionTranslator:
+    """Recursive-descent translation of infix SSA expressions into SMT-LIB terms."""
+
+    COMPARISONS = {"==": "=", "=": "=", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+
+    def __init__(self, rename, select=None):
+        self.rename = rename
+        # Optional select(array_term, index_term) override, used for scalarized arrays
+        self.select = select
+        self.nonlinear = False
+        self.tokens = []
+        self.pos = 0
+
+    def translate(self, expr):
+        self.tokens = tokenize(expr)
+        self.pos = 0
+        term = self._parse_or()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"Unexpected '{self.tokens[self.pos]}' in expression: {expr}")
+        return term
+
+    def translate_store(self, expr):
+        """Split '(store a i v)' into its translated (array, index, value) terms."""
+        self.tokens = tokenize(expr)
+        self.pos = 0
+        self._expect("(")
+        self._expect("store")
+        args = [self._parse_or() for _ in range(3)]
+        self._expect(")")
+        if self.pos != len(self.tokens):
+            raise ValueError(f"Unexpected '{self.tokens[self.pos]}' in expression: {expr}")
+        return args
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _next(self):
+        token = self._peek()
+        if token is None:
+            raise ValueError("Unexpected end of expression")
+        self.pos += 1
+        return token
+
+    def _expect(self, token):
+        if self._next() != token:
+            raise ValueError(f"Expected '{token}' in expression")
+
+    def _parse_or(self):
+        terms = [self._parse_and()]
+        while self._peek() == "||":
+            self._next()
+            terms.append(self._parse_and())
+        return terms[0] if len(terms) == 1 else f"(or {' '.join(terms)})"
+
+    def _parse_and(self):
+        terms = [self._parse_not()]
+        while self._peek() == "&&":
+            self._next()
+            terms.append(self._parse_not())
+        return terms[0] if len(terms) == 1 else f"(and {' '.join(terms)})"
+
+    def _parse_not(self):
+        if self._peek() == "!":
+            self._next()
+            return f"(not {self._parse_not()})"
+        return self._parse_comparison()
+
+    def _parse_comparison(self):
+        left = self._parse_additive()
+        op = self._peek()
+        if op in self.COMPARISONS or op == "!=":
+            self._next()
+            right = self._parse_additive()
+            if op == "!=":
+                return f"(distinct {left} {right})"
+            return f"({self.COMPARISONS[op]} {left} {right})"
+        return left
+
+    def _parse_additive(self):
+        term = self._parse_multiplicative()
+        while self._peek() in ("+", "-"):
+            op = self._next()
+            term = f"({op} {term} {self._parse_multiplicative()})"
+        return term
+
+    def _parse_multiplicative(self):
+        term = self._parse_unary()
+        while self._peek() in ("*", "/", "%"):
+            op = {"*": "*", "/": "div", "%": "mod"}[self._next()]
+            right = self._parse_unary()
+            if not (self._is_numeral(term) or self._is_numeral(right)):
+                self.nonlinear = True
+            term = f"({op} {term} {right})"
+        return term
+
+    def _parse_unary(self):
+        if self._peek() == "-":
+            self._next()
+            return f"(- {self._parse_unary()})"
+        if self._peek() == "!":
+            self._next()
+            return f"(not {self._parse_unary()})"
+        return self._parse_primary()
+
+    def _parse_primary(self):
+        token = self._next()
+        if token == "(":
+            if self._peek() in ("select", "store"):
+                op = self._next()
+                args = [self._parse_or() for _ in range(2 if op == "select" else 3)]
+                self._expect(")")
+                if op == "select" and self.select:
+                    return self.select(*args)
+                return f"({op} {' '.join(args)})"
+            term = self._parse_or()
+            self._expect(")")
+            return term
+        if token.isdigit():
+            return token
+        if token in ("True", "False", "true", "false"):
+            return token.lower()
+        if re.fullmatch(r'[A-Za-z_]\w*', token):
+            return self.rename(token)
+        raise ValueError(f"Unexpected '{token}' in expression")
+
+    def _is_numeral(self, term):
+        return bool(re.fullmatch(r'\d+|\(- \d+\)', term))
+
 class SMTGenerator:
-    def __init__(self):
-        self.declarations = []
-        self.assertions = []
-        self.array_versions = defaultdict(list)
-        self.variables = set()
-        self.array_counter = defaultdict(int)
-        self.initial_values = {}
-        self.has_arrays = False
-        self.var_versions = defaultdict(list)
+    # Verification checks that this array's first n elements end up sorted
+    SORTED_ARRAY = "arr"
+    LENGTH_VARIABLE = "n"
 
-    def generate_smt(self, ssa_instructions, mode="verification", ssa_instructions2=None):
+    def __init__(self, translation_cache=None, array_encoding="auto", max_scalar_array=MAX_SCALAR_ARRAY):
+        # Optional shared map (expression, prefix, ...) -> translation, see incremental.py
+        self.translation_cache = translation_cache
+        # "theory" keeps SMT arrays, "scalar" turns every array of known length whose
+        # indices stay in bounds into one Int per element, "auto" does so when that
+        # length is also at most max_scalar_array
+        if array_encoding not in ARRAY_ENCODINGS:
+            raise ValueError(f"Unknown array encoding: {array_encoding}")
+        self.array_encoding = array_encoding
+        self.max_scalar_array = max_scalar_array
+        self._reset()
+
+    def _reset(self):
         self.declarations = []
         self.assertions = []
         self.array_versions = defaultdict(list)
@@ -21,161 +180,505 @@ class SMTGenerator:
         self.array_counter = defaultdict(int)
         self.initial_values = {}
         self.has_arrays = False
+        self.has_quantifiers = False
+        self.nonlinear = False
+        self.constants = {}
+        self.referenced = set()
+        self.variant_checks = []
+        # Asserted conditions: checked in verification mode, assumed when comparing programs
+        self.properties = []
+        self.arrays = set()
+        self.array_terms = set()
+        self.array_sizes = {}
+        self.encoding_key = (frozenset(), frozenset())
+
+    @classmethod
+    def verification_outputs(cls):
+        """
+        Variables whose final values a verification query reads besides the
+        assertions: those of the sortedness check. Comparisons read every variable.
+        """
+        return {cls.SORTED_ARRAY, cls.LENGTH_VARIABLE}
+
+    def generate_smt(self, ssa_instructions, mode="verification", ssa_instructions2=None):
+        self._reset()
 
         if mode == "verification":
+            self._choose_array_encoding([ssa_instructions])
             self._process_ssa(ssa_instructions, prefix="")
-            if self.has_arrays:
+            if self.SORTED_ARRAY in self.arrays:
                 self._add_sorted_property()
+            # Look for an input that violates a property: unsat means they all hold
+            if self.properties:
+                self.assertions.append(f"(assert (not {self._conjunction(self.properties)}))")
+            else:
+                # Nothing to violate, so there is no counterexample
+                self.assertions.append("(assert false)")
         elif mode == "comparison":
             if not ssa_instructions2:
                 raise ValueError("Comparison mode requires two sets of SSA instructions")
+            self._choose_array_encoding([ssa_instructions, ssa_instructions2])
             self._process_ssa(ssa_instructions, prefix="_1")
             self._process_ssa(ssa_instructions2, prefix="_2")
+            self._assume_properties()
             self._add_equivalence_property()
         else:
             raise ValueError(f"Unknown mode: {mode}")
+        self._declare_free_variables()
 
-        smt_code = ["(set-logic QF_AUFLIA)"]
-        smt_code.extend(sorted(set(self.declarations)))
-        for var, value in self.initial_values.items():
-            smt_code.append(f"(assert (= {var} {value}))")
-        smt_code.extend(self.assertions)
+        smt_code = self._preamble()
         smt_code.append("(check-sat)")
         smt_code.append("(get-model)")
         smt_code.append("(exit)")
         return "\n".join(smt_code)
 
-    def _process_ssa(self, ssa_instructions, prefix=""):
+    def encode(self, ssa_instructions, prefix=""):
+        """
+        Add the declarations and constraints of SSA instructions under a name
+        prefix, for callers that build their own queries. Asserts are collected
+        in properties rather than asserted.
+        """
+        self._process_ssa(ssa_instructions, prefix)
+
+    def translate(self, expr, prefix=""):
+        """SMT term of an SSA expression under a name prefix."""
+        return self._translate_expression(expr, prefix)
+
+    def script(self, commands):
+        """The complete script: logic, declarations and constraints, followed by the given commands."""
+        self._declare_free_variables()
+        return "\n".join(self._preamble() + list(commands))
+
+    def generate_multi_equivalence_smt(self, reference_ssa, candidate_ssas):
+        """
+        Encode the reference once and each candidate under its own activation
+        literal, then check every candidate with check-sat-assuming in one script.
+        unsat for a variant means it is equivalent to the reference; sat comes
+        with a get-value counterexample. The compared terms of each variant are
+        left in self.variant_checks, in the same order as the checks.
+        """
+        self._reset()
+        self._choose_array_encoding([reference_ssa] + list(candidate_ssas))
+        self._process_ssa(reference_ssa, prefix="_r")
+        for i, candidate_ssa in enumerate(candidate_ssas, 1):
+            self._process_ssa(candidate_ssa, prefix=f"_v{i}")
+        self._assume_properties()
+
+        for i in range(1, len(candidate_ssas) + 1):
+            prefix = f"_v{i}"
+            activation = f"act{prefix}"
+            pairs = self._equivalence_pairs("_r", prefix)
+            if not pairs:
+                raise ValueError(f"No variables to compare between the reference and variant {i}")
+            inputs = self._link_inputs("_r", prefix)
+            equalities = [f"(= {ref} {cand})" for _, ref, cand in pairs]
+            all_equal = equalities[0] if len(equalities) == 1 else f"(and {' '.join(equalities)})"
+            self.declarations.append(f"(declare-fun {activation} () Bool)")
+            self.assertions.append(f"(assert (=> {activation} (not {all_equal})))")
+            self.variant_checks.append({"name": f"Variant {i}", "activation": activation, "pairs": pairs, "inputs": inputs})
+        self._declare_free_variables()
+
+        smt_code = self._preamble()
+        for check in self.variant_checks:
+            terms = check["inputs"] + [term for _, ref, cand in check["pairs"] for term in (ref, cand)]
+            smt_code.append(f"(check-sat-assuming ({check['activation']}))")
+            smt_code.append(f"(get-value ({' '.join(terms)}))")
+        smt_code.append("(exit)")
+        return "\n".join(smt_code)
+
+    def _preamble(self):
+        smt_code = [f"(set-logic {self._select_logic()})"]
+        smt_code.extend(sorted(set(self.declarations)))
+        for var, value in self.initial_values.items():
+            smt_code.append(f"(assert (= {var} {value}))")
+        smt_code.extend(self.assertions)
+        return smt_code
+
+    def _collect_arrays(self, ssa_instructions):
+        arrays = set()
+        for instr in ssa_instructions:
+            arrays.update(ARRAY_ACCESS.findall(instr.expression))
+        return arrays
+
+    def _register_arrays(self, arrays):
+        if not arrays <= self.arrays:
+            self.arrays |= arrays
+            self.encoding_key = (frozenset(self.arrays), frozenset(self.array_sizes.items()))
+
+    def _choose_array_encoding(self, ssa_lists):
+        """
+        Scalarize the arrays (one Int per element, ite-based selects) when their
+        length is known: the program's length variable n is set to the same
+        constant in every program of the query, and every index the programs use
+        provably lies in 0..n-1, since the elements outside that range have no
+        variables. Otherwise the arrays stay in the array theory.
+        """
+        self.array_sizes = {}
+        arrays = set()
+        for ssa in ssa_lists:
+            arrays |= self._collect_arrays(ssa)
+        self._register_arrays(arrays)
+        if not arrays or self.array_encoding == "theory":
+            return
+        size = self._constant_length(ssa_lists)
+        if size is None or size < 1 or (self.array_encoding == "auto" and size > self.max_scalar_array):
+            return
+        if not all(self._indices_in_range(ssa, size) for ssa in ssa_lists):
+            return
+        self.array_sizes = {name: size for name in arrays}
+        self.encoding_key = (frozenset(self.arrays), frozenset(self.array_sizes.items()))
+
+    def _indices_in_range(self, ssa_instructions, size):
+        """Whether every select and store index of a program has only values in 0..size-1."""
+        values = {}
+        indices = []
+
+        def select(array, index):
+            indices.append(index)
+            return f"(select {array} {index})"
+
+        translator = ExpressionTranslator(lambda var: var, select)
         for instr in ssa_instructions:
-            if "arr_" in instr.target or "arr_" in instr.expression:
-                self.has_arrays = True
-                break
+            expr = instr.expression
+            if "φ" in expr:
+                match = re.match(r'φ\(([^,]+),\s*([^,]+),\s*([^)]+)\)', expr)
+                if match and not self._array_name(instr.target):
+                    true_values, false_values = (values.get(match.group(k).strip()) for k in (2, 3))
+                    if true_values is not None and false_values is not None:
+                        values[instr.target] = true_values | false_values
+                continue
+            if self._array_name(instr.target) and expr.lstrip().startswith("(store"):
+                indices.append(translator.translate_store(expr)[1])
+                continue
+            term = translator.translate(expr)
+            if instr.target != "assert" and not self._is_condition(instr.target):
+                values[instr.target] = self._term_values(term, values)
+        return all(index_values is not None and all(0 <= v < size for v in index_values)
+                   for index_values in (self._term_values(index, values) for index in indices))
+
+    def _term_values(self, term, values, limit=256):
+        """
+        The values an integer SMT term can take, given the possible values of
+        the SSA variables it reads, or None when they are not known to be a
+        small finite set (inputs, division, selects, ...).
+        """
+        tokens = re.findall(r'[()]|[^\s()]+', term)
+        pos = 0
+
+        def parse():
+            nonlocal pos
+            token = tokens[pos]
+            pos += 1
+            if token != "(":
+                if token.isdigit():
+                    return {int(token)}
+                return values.get(token)
+            op = tokens[pos]
+            pos += 1
+            args = []
+            while tokens[pos] != ")":
+                args.append(parse())
+            pos += 1
+            if op not in ("+", "-", "*") or any(arg is None for arg in args):
+                return None
+            if op == "-" and len(args) == 1:
+                return {-v for v in args[0]}
+            result = args[0]
+            for arg in args[1:]:
+                combine = {"+": lambda a, b: a + b, "-": lambda a, b: a - b, "*": lambda a, b: a * b}[op]
+                result = {combine(a, b) for a in result for b in arg}
+                if len(result) > limit:
+                    return None
+            return result
+
+        return parse()
 
-        if self.has_arrays:
-            current_array = f"arr_0{prefix}"
-            self.declarations.append(f"(declare-fun {current_array} () (Array Int Int))")
-            self.array_versions["arr"].append(current_array)
+    def _constant_length(self, ssa_lists):
+        values = set()
+        for ssa in ssa_lists:
+            assigned = [instr.expression.strip() for instr in ssa if instr.target.rsplit("_", 1)[0] == self.LENGTH_VARIABLE]
+            if not assigned or not all(re.fullmatch(r'\d+', value) for value in assigned):
+                return None
+            values.update(int(value) for value in assigned)
+        return values.pop() if len(values) == 1 else None
+
+    def _array_name(self, term, prefix=""):
+        """Array a (possibly prefixed) versioned term belongs to, or None for scalars."""
+        if prefix and term.endswith(prefix):
+            term = term[:-len(prefix)]
+        name = term.rsplit("_", 1)[0]
+        return name if name in self.arrays else None
+
+    def _elements(self, array_term, name):
+        terms = [f"{array_term}_e{k}" for k in range(self.array_sizes[name])]
+        self.referenced.update(terms)
+        return terms
+
+    def _array_term(self, term):
+        """Record a theory-encoded array term so it gets declared with the array sort."""
+        self.array_terms.add(term)
+        self.referenced.add(term)
+        return term
+
+    def _final_version(self, var, prefix):
+        versions = [v for v in self.var_versions[var] if v.endswith(prefix)]
+        if versions:
+            return versions[-1]
+        # Never assigned: the program leaves its input value untouched
+        self.referenced.add(f"{var}_0{prefix}")
+        return f"{var}_0{prefix}"
+
+    def _final_array(self, name, prefix):
+        versions = [v for v in self.array_versions[name] if v.endswith(prefix)]
+        return versions[-1] if versions else f"{name}_0{prefix}"
+
+    def _equivalence_pairs(self, prefix1, prefix2):
+        """(variable, final term in program 1, final term in program 2) for every variable either program assigns."""
+        names = sorted(var for var, versions in self.var_versions.items()
+                       if any(v.endswith(prefix1) or v.endswith(prefix2) for v in versions))
+        pairs = [(var, self._final_version(var, prefix1), self._final_version(var, prefix2)) for var in names]
+        for name in sorted(self.arrays):
+            final1, final2 = self._final_array(name, prefix1), self._final_array(name, prefix2)
+            if name in self.array_sizes:
+                pairs.extend((f"{name}[{k}]", element1, element2) for k, (element1, element2)
+                             in enumerate(zip(self._elements(final1, name), self._elements(final2, name))))
+            else:
+                pairs.append((name, self._array_term(final1), self._array_term(final2)))
+        return pairs
+
+    def _link_inputs(self, prefix1, prefix2):
+        """Constrain both programs to start from the same inputs; returns the shared input terms."""
+        bases = set()
+        for var in self.referenced:
+            for prefix in (prefix1, prefix2):
+                match = re.fullmatch(rf'(\w+)_0{prefix}', var)
+                if match:
+                    bases.add(match.group(1))
+        inputs = []
+        for base in sorted(bases):
+            input1, input2 = f"{base}_0{prefix1}", f"{base}_0{prefix2}"
+            self.referenced.update((input1, input2))
+            if base in self.arrays:
+                self.array_terms.update((input1, input2))
+            self.assertions.append(f"(assert (= {input1} {input2}))")
+            inputs.append(input1)
+        for name in sorted(self.array_sizes):
+            self._link_scalar_array(name, prefix1, prefix2)
+        return inputs
+
+    def _link_scalar_array(self, name, prefix1, prefix2):
+        """Start a scalarized array from the same contents in both programs."""
+        initial1 = self._elements(f"{name}_0{prefix1}", name) + [f"{name}_oob{prefix1}"]
+        initial2 = self._elements(f"{name}_0{prefix2}", name) + [f"{name}_oob{prefix2}"]
+        self.referenced.update(initial1 + initial2)
+        for term1, term2 in zip(initial1, initial2):
+            self.assertions.append(f"(assert (= {term1} {term2}))")
+
+    def _process_ssa(self, ssa_instructions, prefix=""):
+        arrays = self._collect_arrays(ssa_instructions)
+        self._register_arrays(arrays)
+        if arrays:
+            self.has_arrays = True
+        for name in sorted(arrays):
+            initial = f"{name}_0{prefix}"
+            if name not in self.array_sizes:
+                self.declarations.append(f"(declare-fun {initial} () {ARRAY_SORT})")
+                self.array_terms.add(initial)
+            self.array_versions[name].append(initial)
 
         for i, instr in enumerate(ssa_instructions):
             target = f"{instr.target}{prefix}"
             expr = instr.expression
+            array_name = self._array_name(instr.target)
 
-            if target not in self.variables and not target.startswith("arr_") and target != "assert":
+            if target not in self.variables and not array_name and target != "assert":
                 self.variables.add(target)
-                self.declarations.append(f"(declare-fun {target} () Int)")
+                sort = "Bool" if self._is_condition(instr.target) else "Int"
+                self.declarations.append(f"(declare-fun {target} () {sort})")
                 base_var = instr.target.split('_')[0]
                 if base_var not in ("cond", "while", "for", "assert"):
                     self.var_versions[base_var].append(target)
 
             if "φ" in expr:
-                self._handle_phi_node(target, expr, prefix)
-            elif target.startswith("arr_"):
-                self._handle_array_assignment(target, expr, prefix)
+                self._handle_phi_node(target, expr, prefix, array_name)
+            elif array_name:
+                self._handle_array_assignment(target, expr, prefix, array_name)
             elif target == "assert":
-                smt_expr = self._translate_expression(expr, prefix)
-                match = re.match(r'^\s*(\w+)\s*(==|=)\s*(\d+|\w+)\s*$', expr)
-                if match:
-                    left, _, right = match.groups()
-                    left = f"{left}{prefix}"
-                    smt_expr = f"(= {left} {right})"
-                else:
-                    smt_expr = smt_expr.replace("==", "=")
-                    smt_expr = smt_expr.strip()
-                    if not smt_expr.startswith("("):
-                        smt_expr = f"({smt_expr})"
-                self.assertions.append(f"(assert {smt_expr})")
-            elif target in ("while_cond", "for_cond") or target.startswith("cond_"):
+                self.properties.append(self.assertion_term(instr, prefix))
+            elif self._is_condition(instr.target):
                 self.assertions.append(f"(assert (= {target} {self._translate_expression(expr, prefix)}))")
             else:
                 smt_expr = self._translate_expression(expr, prefix)
+                if re.fullmatch(r'\s*\d+\s*', expr):
+                    self.constants[target] = int(expr)
                 if re.match(r'^\w+_1\s*:=\s*.+$', f"{target} := {expr}") and i == 0:
                     self.initial_values[target] = smt_expr
                 else:
                     self.assertions.append(f"(assert (= {target} {smt_expr}))")
 
-    def _handle_phi_node(self, target, expr, prefix):
+    def assertion_term(self, instr, prefix=""):
+        """An assert's condition, required only when the branches enclosing it are taken."""
+        term = self._translate_expression(instr.expression, prefix)
+        if not instr.path:
+            return term
+        literals = [f"{cond}{prefix}" if taken else f"(not {cond}{prefix})" for cond, taken in instr.path]
+        self.referenced.update(f"{cond}{prefix}" for cond, _ in instr.path)
+        return f"(=> {self._conjunction(literals)} {term})"
+
+    def _handle_phi_node(self, target, expr, prefix, array_name=None):
         match = re.match(r'φ\(([^,]+),\s*([^,]+),\s*([^)]+)\)', expr)
         if not match:
             raise ValueError(f"Invalid phi node: {expr}")
-        cond = f"{match.group(1)}{prefix}"
-        val1 = f"{match.group(2)}{prefix}"
-        val2 = f"{match.group(3)}{prefix}"
+        cond = f"{match.group(1).strip()}{prefix}"
+        val1 = f"{match.group(2).strip()}{prefix}"
+        val2 = f"{match.group(3).strip()}{prefix}"
         self.variables.add(target)
-        self.declarations.append(f"(declare-fun {target} () Int)")
+        self.referenced.add(cond)
+        if array_name:
+            self.array_versions[array_name].append(target)
+        if array_name in self.array_sizes:
+            merged = zip(self._elements(target, array_name), self._elements(val1, array_name), self._elements(val2, array_name))
+            for element, true_element, false_element in merged:
+                self.assertions.append(f"(assert (= {element} (ite {cond} {true_element} {false_element})))")
+            return
+        if array_name:
+            self.array_terms.update((target, val1, val2))
+        self.referenced.update((val1, val2))
+        sort = ARRAY_SORT if array_name else "Int"
+        self.declarations.append(f"(declare-fun {target} () {sort})")
         self.assertions.append(f"(assert (= {target} (ite {cond} {val1} {val2})))")
 
-    def _handle_array_assignment(self, target, expr, prefix):
-        self.array_counter["arr"] += 1
-        new_array = target
-        self.declarations.append(f"(declare-fun {new_array} () (Array Int Int))")
-        self.array_versions["arr"].append(new_array)
-        smt_expr = self._translate_expression(expr, prefix)
-        self.assertions.append(f"(assert (= {new_array} {smt_expr}))")
-
-    def _translate_expression(self, expr, prefix):
-        def replace_var(match):
-            var = match.group(0)
-            if var in ('if', 'else', 'while', 'for', 'assert', 'True', 'False', 'select', 'store'):
-                return var
-            return f"{var}{prefix}"
-
-        expr = re.sub(r'\b[a-zA-Z_]\w*\b', replace_var, expr)
-        expr = expr.replace(":=", "=")
-        expr = expr.replace("&&", "and")
-        expr = expr.replace("||", "or")
-        expr = expr.replace("!", "not")
-        expr = re.sub(r'(\w+)\s*\+\s*(\d+|\w+)', r'(+ \1 \2)', expr)
-        expr = re.sub(r'(\w+)\s*-\s*(\w+|\d+)', r'(- \1 \2)', expr)
-        expr = re.sub(r'(\w+)\s*>\s*(\w+|\d+|\(.+?\))', r'(> \1 \2)', expr)
-        expr = re.sub(r'(\w+)\s*<\s*(\w+|\d+|\(.+?\))', r'(< \1 \2)', expr)
-        return expr
+    def _handle_array_assignment(self, target, expr, prefix, array_name):
+        self.array_counter[array_name] += 1
+        self.array_versions[array_name].append(target)
+        if array_name not in self.array_sizes:
+            self.declarations.append(f"(declare-fun {target} () {ARRAY_SORT})")
+            self.array_terms.add(target)
+            smt_expr = self._translate_expression(expr, prefix)
+            self.assertions.append(f"(assert (= {target} {smt_expr}))")
+            return
+        # Scalarized: each element either takes the stored value or keeps the old one
+        array, index, value = self._translate_expression(expr, prefix, store=True)
+        updated = zip(self._elements(target, array_name), self._elements(array, array_name))
+        for k, (element, old_element) in enumerate(updated):
+            if re.fullmatch(r'\d+', index):
+                new_value = value if int(index) == k else old_element
+            else:
+                new_value = f"(ite (= {index} {k}) {value} {old_element})"
+            self.assertions.append(f"(assert (= {element} {new_value}))")
+
+    def _translate_expression(self, expr, prefix, store=False):
+        key = (expr, prefix, store, self.encoding_key)
+        cached = self.translation_cache.get(key) if self.translation_cache is not None else None
+        if cached is None:
+            referenced = set()
+            array_terms = set()
+
+            def rename(var):
+                term = f"{var}{prefix}"
+                array_name = self._array_name(var)
+                if array_name in self.array_sizes:
+                    # Only its elements end up in the query
+                    return term
+                referenced.add(term)
+                if array_name:
+                    array_terms.add(term)
+                return term
+
+            def select(array, index):
+                array_name = self._array_name(array, prefix)
+                if array_name not in self.array_sizes:
+                    return f"(select {array} {index})"
+                size = self.array_sizes[array_name]
+                out_of_range = f"{array_name}_oob{prefix}"
+                if re.fullmatch(r'\d+', index):
+                    term = f"{array}_e{index}" if int(index) < size else out_of_range
+                    referenced.add(term)
+                    return term
+                referenced.add(out_of_range)
+                term = out_of_range
+                for k in reversed(range(size)):
+                    referenced.add(f"{array}_e{k}")
+                    term = f"(ite (= {index} {k}) {array}_e{k} {term})"
+                return term
+
+            translator = ExpressionTranslator(rename, select if self.array_sizes else None)
+            translated = tuple(translator.translate_store(expr)) if store else translator.translate(expr)
+            cached = (translated, frozenset(referenced), translator.nonlinear, frozenset(array_terms))
+            if self.translation_cache is not None:
+                self.translation_cache.put(key, cached)
+        smt_expr, referenced, nonlinear, array_terms = cached
+        self.referenced.update(referenced)
+        self.array_terms.update(array_terms)
+        self.nonlinear = self.nonlinear or nonlinear
+        return smt_expr
+
+    def _declare_free_variables(self):
+        """Declare variables that are read but never assigned (e.g. x_0 inputs)."""
+        declared = {re.match(r'\(declare-fun (\S+)', d).group(1) for d in self.declarations}
+        for var in sorted(self.referenced - declared):
+            if var in self.array_terms:
+                sort = ARRAY_SORT
+            elif self._is_condition(var):
+                sort = "Bool"
+            else:
+                sort = "Int"
+            self.declarations.append(f"(declare-fun {var} () {sort})")
+
+    def _is_condition(self, target):
+        return target in CONDITION_TARGETS or target.startswith("cond_")
+
+    def _select_logic(self):
+        """Pick the cheapest logic covering the features actually used by the query."""
+        uses_arrays = any("(Array " in declaration for declaration in self.declarations)
+        logic = ("A" if uses_arrays else "") + ("NIA" if self.nonlinear else "LIA")
+        if not self.has_quantifiers:
+            return f"QF_{logic}"
+        return "AUFNIRA" if logic == "ANIA" else logic
 
     def _add_sorted_property(self):
-        final_array = self.array_versions["arr"][-1]
-        n_var = "n_1"
+        name, length = self.SORTED_ARRAY, self.LENGTH_VARIABLE
+        final_array = self.array_versions[name][-1]
+        n_var = self.var_versions[length][-1] if self.var_versions[length] else f"{length}_0"
         if n_var not in self.variables:
             self.declarations.append(f"(declare-fun {n_var} () Int)")
             self.variables.add(n_var)
-        self.declarations.append("(declare-fun k () Int)")
-        self.assertions.append(
-            f"(assert (forall ((k Int)) (=> (and (<= 0 k) (< k (- {n_var} 1))) (<= (select {final_array} k) (select {final_array} (+ k 1))))))"
-        )
+        n_value = self.constants.get(n_var, self.initial_values.get(n_var))
+        if name in self.array_sizes:
+            elements = self._elements(final_array, name)
+            pairs = [f"(<= {elements[k]} {elements[k + 1]})" for k in range(len(elements) - 1)]
+        elif n_value is not None and re.fullmatch(r'\d+', str(n_value)):
+            # Concrete bound: expand over k so the query stays quantifier-free
+            self._array_term(final_array)
+            pairs = [f"(<= (select {final_array} {k}) (select {final_array} {k + 1}))" for k in range(int(n_value) - 1)]
+        else:
+            self.has_quantifiers = True
+            self._array_term(final_array)
+            self.properties.append(
+                f"(forall ((k Int)) (=> (and (<= 0 k) (< k (- {n_var} 1))) (<= (select {final_array} k) (select {final_array} (+ k 1)))))"
+            )
+            return
+        if pairs:
+            self.properties.append(self._conjunction(pairs))
+
+    def _conjunction(self, terms):
+        return terms[0] if len(terms) == 1 else f"(and {' '.join(terms)})"
+
+    def _assume_properties(self):
+        for term in self.properties:
+            self.assertions.append(f"(assert {term})")
 
     def _add_equivalence_property(self):
-        # Compare arrays if they exist
-        if self.has_arrays:
-            arr_versions_1 = [v for v in self.array_versions["arr"] if v.endswith("_1")]
-            arr_versions_2 = [v for v in self.array_versions["arr"] if v.endswith("_2")]
-            if arr_versions_1 and arr_versions_2:
-                arr1 = arr_versions_1[-1]
-                arr2 = arr_versions_2[-1]
-                self.assertions.append(f"(assert (= arr_0_1 arr_0_2))")
-                self.assertions.append(f"(assert (= {arr1} {arr2}))")
-            else:
-                raise ValueError("Array versions missing in one of the programs")
-
-        # Compare scalar variables
-        compared_vars = set()
-        for var in self.var_versions:
-            versions_1 = [v for v in self.var_versions[var] if v.endswith("_1")]
-            versions_2 = [v for v in self.var_versions[var] if v.endswith("_2")]
-            if versions_1 and versions_2:
-                var1 = versions_1[-1]
-                var2 = versions_2[-1]
-                self.assertions.append(f"(assert (= {var1} {var2}))")
-                compared_vars.add(var)
-            elif versions_1:
-                var1 = versions_1[-1]
-                self.declarations.append(f"(declare-fun {var}_0_2 () Int)")
-                self.assertions.append(f"(assert (= {var}_0_2 0))")
-                self.assertions.append(f"(assert (= {var1} {var}_0_2))")
-                compared_vars.add(var)
-            elif versions_2:
-                var2 = versions_2[-1]
-                self.declarations.append(f"(declare-fun {var}_0_1 () Int)")
-                self.assertions.append(f"(assert (= {var}_0_1 0))")
-                self.assertions.append(f"(assert (= {var}_0_1 {var2}))")
-                compared_vars.add(var)
-
-        if not compared_vars and not self.has_arrays:
-            raise ValueError("No variables to compare between programs")
\ No newline at end of file
+        """
+        Look for shared inputs on which the two programs end in different states:
+        unsat means they are equivalent, as in the multi-variant encoding.
+        """
+        for name in sorted(self.arrays):
+            if not any(v.endswith("_1") for v in self.array_versions[name]) or not any(v.endswith("_2") for v in self.array_versions[name]):
+                raise ValueError(f"Array {name} is missing in one of the programs")
+        pairs = self._equivalence_pairs("_1", "_2")
+        if not pairs:
+            raise ValueError("No variables to compare between programs")
+        self._link_inputs("_1", "_2")
+        equalities = [f"(= {term1} {term2})" for _, term1, term2 in pairs]
+        self.assertions.append(f"(assert (not {self._conjunction(equalities)}))")
@@ -1,23 +1,43 @@
 import re
 from collections import defaultdict
 import copy
+from cfg import ControlFlowGraph, statement_live_in
+from intervals import nested_loops
+
+# "minimal" places phis on the CFG's dominance frontiers where the value is live,
+# "structured" is the original construction that merges every modified variable after an if
+PHI_PLACEMENTS = ("minimal", "structured")
 
 class SSAInstruction:
-    def __init__(self, target, expression):
+    def __init__(self, target, expression, path=()):
         self.target = target
         self.expression = expression
+        # For asserts: (cond_var, taken) for every enclosing if, outermost first
+        self.path = tuple(path)
 
     def __repr__(self):
+        if self.path:
+            conditions = " && ".join(cond if taken else f"!{cond}" for cond, taken in self.path)
+            return f"{self.target} := {self.expression}  // when {conditions}"
         return f"{self.target} := {self.expression}"
 
 class SSAConverter:
-    def __init__(self):
+    def __init__(self, guard=None, phi_placement="minimal"):
+        if phi_placement not in PHI_PLACEMENTS:
+            raise ValueError(f"Unknown phi placement '{phi_placement}', expected one of {', '.join(PHI_PLACEMENTS)}")
+        self.guard = guard
+        self.phi_placement = phi_placement
         self.instructions = []
         self.current_versions = defaultdict(int)
         self.var_stack = defaultdict(list)
         self.seen_vars = set()
         self.cond_counter = 0
         self.array_versions = defaultdict(int)
+        self.array_counter = defaultdict(int)
+        # Optional per-loop unroll depths keyed by id(loop node), see intervals.py
+        self.loop_depths = {}
+        # Branch decisions enclosing the statement being converted
+        self.path = []
 
     def get_versioned_var(self, var):
         if self.var_stack[var]:
@@ -39,19 +59,46 @@ class SSAConverter:
         self.cond_counter += 1
         return f"cond_{self.cond_counter}"
 
+    def new_array_version(self, array_name):
+        self.array_counter[array_name] += 1
+        self.array_versions[array_name] = self.array_counter[array_name]
+        versioned = f"{array_name}_{self.array_versions[array_name]}"
+        self.var_stack[array_name] = [versioned]
+        return versioned
+
+    def _wrap(self, expr):
+        """Parenthesize non-atomic operands so select/store arguments stay unambiguous."""
+        expr = expr.strip()
+        if re.fullmatch(r'\w+', expr):
+            return expr
+        if expr.startswith("(") and expr.endswith(")"):
+            depth = 0
+            for i, ch in enumerate(expr):
+                depth += {"(": 1, ")": -1}.get(ch, 0)
+                if depth == 0:
+                    break
+            if i == len(expr) - 1:
+                return expr
+        return f"({expr})"
+
     def _replace_vars(self, expr):
-        # Handle array accesses (e.g., arr[j], arr[j+1])
+        # Handle array accesses (e.g., arr[j], arr[j+1]). They are swapped for
+        # placeholders so the versioned select terms are not renamed again below.
+        selects = []
+
         def replace_array_access(match):
             array_name = match.group(1)
             index_expr = self._replace_vars_in_expr(match.group(2))
             array_version = self.array_versions[array_name]
-            return f"(select {array_name}_{array_version} {index_expr})"
+            selects.append(f"(select {array_name}_{array_version} {self._wrap(index_expr)})")
+            return f"\0{len(selects) - 1}\0"
 
         # Replace array accesses
         expr = re.sub(r'(\w+)\[([^\]]+)\]', replace_array_access, expr)
 
         # Replace variables in the rest of the expression
-        return self._replace_vars_in_expr(expr)
+        expr = self._replace_vars_in_expr(expr)
+        return re.sub(r'\0(\d+)\0', lambda m: selects[int(m.group(1))], expr)
 
     def _replace_vars_in_expr(self, expr):
         def replace_var(match):
@@ -64,23 +111,210 @@ class SSAConverter:
         var_pattern = r'\b[a-zA-Z_]\w*\b'
         return re.sub(var_pattern, replace_var, expr)
 
-    def convert(self, ast, unroll_depth=0):
+    def reset(self):
         self.instructions = []
         self.current_versions.clear()
         self.var_stack.clear()
         self.seen_vars.clear()
         self.cond_counter = 0
         self.array_versions.clear()
-        
-        if unroll_depth > 0 and any(stmt.type in ["While", "For"] for stmt in ast.statements):
-            self._convert_with_unrolling(ast, unroll_depth)
+        self.array_counter.clear()
+        self.path = []
+
+    def convert(self, ast, unroll_depth=0, loop_depths=None, live_out=None):
+        """
+        live_out names the variables whose final values are observed; None means
+        all of them (program comparison). Only minimal phi placement uses it.
+        """
+        self.reset()
+        self.loop_depths = loop_depths or {}
+        depth = unroll_depth if self.uses_unrolling(ast, unroll_depth) else 0
+
+        if self.phi_placement == "minimal":
+            for stmt, stmt_live_out in zip(ast.statements, self.live_outs(ast.statements, live_out)):
+                self.convert_statement(stmt, depth, stmt_live_out)
+        elif depth:
+            self._convert_with_unrolling(ast, depth)
         else:
             self._convert_block(ast)
         
         return self.instructions
 
+    def uses_unrolling(self, ast, unroll_depth):
+        if self.phi_placement == "minimal":
+            # Every loop is unrolled, including loops nested in an if
+            return unroll_depth > 0 and any(stmt.type in ["While", "For"] or nested_loops(stmt) for stmt in ast.statements)
+        return unroll_depth > 0 and any(stmt.type in ["While", "For"] for stmt in ast.statements)
+
+    def live_outs(self, statements, live_out=None):
+        """Variables live after each top-level statement."""
+        if live_out is None:
+            live_out = self._collect_variables_in_block(StmtBlock(statements))
+        live = frozenset(live_out)
+        result = []
+        for stmt in reversed(statements):
+            result.append(live)
+            live = frozenset(statement_live_in(stmt, live))
+        return result[::-1]
+
+    def convert_statement(self, stmt, unroll_depth=0, live_out=None):
+        """
+        Convert one top-level statement on top of the current state. Calling it for
+        every statement of a program gives the same result as convert(), provided
+        unroll_depth is 0 whenever uses_unrolling() is false for the whole program
+        and live_out comes from live_outs().
+        """
+        if self.phi_placement == "minimal":
+            self._convert_region([stmt], unroll_depth, live_out)
+        elif unroll_depth > 0:
+            self._convert_with_unrolling(StmtBlock([stmt]), unroll_depth)
+        else:
+            self._convert_block(StmtBlock([stmt]))
+
+    def convert_fragment(self, statements, guard=None):
+        """
+        Convert a loop-free statement list with the structured construction, from
+        a fresh state where every variable is read as its _0 version. A guard
+        condition, when given, comes first as a while_cond instruction. The
+        versions at the end are then available from final_version().
+        """
+        self.reset()
+        if guard:
+            self.instructions.append(SSAInstruction("while_cond", self._replace_vars(guard)))
+        self._convert_block(StmtBlock(statements))
+        return self.instructions
+
+    def final_version(self, var):
+        """The version a variable or array holds at the end of the converted code."""
+        if var in self.array_versions:
+            return f"{var}_{self.array_versions[var]}"
+        stack = self.var_stack.get(var)
+        return stack[-1] if stack else f"{var}_0"
+
+    def variables_in(self, statements):
+        """Variables and arrays a statement list reads or writes."""
+        return self._collect_variables_in_block(StmtBlock(statements))
+
+    def modified_variables(self, statements):
+        """Variables and arrays a statement list may assign."""
+        return self._collect_modified_variables(StmtBlock(statements))
+
+    def footprint(self, stmt):
+        """Variables and arrays a top-level statement can read or write."""
+        return sorted(self._collect_variables_in_block(StmtBlock([stmt])))
+
+    def state_key(self, variables):
+        """Hashable summary of the incoming versions of the given variables."""
+        return (self.cond_counter,) + tuple(
+            (var, tuple(self.var_stack.get(var, ())), self.current_versions.get(var, 0), var in self.seen_vars,
+             self.array_versions.get(var, -1), self.array_counter.get(var, 0))
+            for var in variables
+        )
+
+    def snapshot_state(self, variables):
+        """
+        State of the given variables, used to resume conversion after a cached
+        statement. Converting a statement only changes the state of its own
+        footprint (besides the condition counter), so that is all we keep.
+        """
+        return self.cond_counter, [
+            (var, list(self.var_stack.get(var, ())), self.current_versions.get(var, 0), var in self.seen_vars,
+             self.array_versions.get(var, -1), self.array_counter.get(var, 0))
+            for var in variables
+        ]
+
+    def restore_state(self, state):
+        self.cond_counter, variables = state
+        for var, stack, version, seen, array_version, array_count in variables:
+            self.var_stack[var] = list(stack)
+            self.current_versions[var] = version
+            if seen:
+                self.seen_vars.add(var)
+            else:
+                self.seen_vars.discard(var)
+            if array_version >= 0:
+                self.array_versions[var] = array_version
+            else:
+                self.array_versions.pop(var, None)
+            self.array_counter[var] = array_count
+
+    def _checkpoint(self):
+        """Give the request guard a chance to cancel the conversion or enforce its SSA budget."""
+        if self.guard:
+            self.guard.check(ssa_count=len(self.instructions))
+
+    def _convert_region(self, statements, unroll_depth, live_out=None):
+        """
+        Minimal, pruned SSA for a statement list: build its control-flow graph,
+        place phis on the iterated dominance frontiers of each variable's
+        definitions where the variable is live, then rename block by block in
+        reverse postorder. A join takes the versions from its immediate
+        dominator, so variables without a phi there keep the dominating
+        definition.
+        """
+        if live_out is None:
+            live_out = self._collect_variables_in_block(StmtBlock(statements))
+        cfg = ControlFlowGraph.build(statements, self.new_cond_var, unroll_depth, self.loop_depths)
+        order, idom, phis = cfg.place_phis(live_out)
+        self._load_state(self._save_state())
+        exits = {}
+        for block in order:
+            if block.branch:
+                self._load_state(exits[idom[block]])
+                cond_var, true_pred, false_pred = block.branch
+                self._emit_phis(cond_var, exits[true_pred], exits[false_pred], phis[block])
+            elif block is not cfg.entry:
+                self._load_state(exits[block.preds[0]])
+            for op in block.ops:
+                self._emit(op)
+            exits[block] = self._save_state()
+        self._load_state(exits[cfg.exit])
+
+    def _save_state(self):
+        return {var: stack[-1] for var, stack in self.var_stack.items() if stack}, dict(self.array_versions)
+
+    def _load_state(self, state):
+        versions, arrays = state
+        self.var_stack = defaultdict(list, {var: [version] for var, version in versions.items()})
+        self.array_versions = defaultdict(int, arrays)
+
+    def _emit_phis(self, cond_var, true_state, false_state, variables):
+        """Phis at a join for the given variables, skipping those whose incoming versions agree."""
+        (true_vars, true_arrays), (false_vars, false_arrays) = true_state, false_state
+        arrays = {var for var in variables if var in true_arrays or var in false_arrays}
+        for var in sorted(variables - arrays):
+            true_ver = true_vars.get(var, f"{var}_0")
+            false_ver = false_vars.get(var, f"{var}_0")
+            if true_ver != false_ver:
+                phi_var = self.new_version(var)
+                self.instructions.append(SSAInstruction(phi_var, f"φ({cond_var}, {true_ver}, {false_ver})"))
+                self.var_stack[var] = [phi_var]
+            else:
+                self.var_stack[var] = [true_ver]
+        self._merge_arrays(cond_var, {arr: true_arrays.get(arr, 0) for arr in arrays},
+                           {arr: false_arrays.get(arr, 0) for arr in arrays})
+
+    def _emit(self, op):
+        self._checkpoint()
+        kind = op[0]
+        if kind == "assign":
+            expr = self._replace_vars(op[2])
+            self.instructions.append(SSAInstruction(self.new_version(op[1]), expr))
+        elif kind == "store":
+            array_name = op[1]
+            index_expr = self._replace_vars(op[2])
+            expr = self._replace_vars(op[3])
+            prev_version = self.array_versions[array_name]
+            target = self.new_array_version(array_name)
+            self.instructions.append(SSAInstruction(target, f"(store {array_name}_{prev_version} {self._wrap(index_expr)} {self._wrap(expr)})"))
+        elif kind == "assert":
+            self.instructions.append(SSAInstruction("assert", self._replace_vars(op[1]), op[2]))
+        else:
+            self.instructions.append(SSAInstruction(op[1], self._replace_vars(op[2])))
+
     def _convert_block(self, block, is_loop_body=False):
         for stmt in block.statements:
+            self._checkpoint()
             if stmt.type == "Assign":
                 expr = self._replace_vars(stmt.expression)
                 target = self.new_version(stmt.variable)
@@ -88,19 +322,16 @@ class SSAConverter:
 
             elif stmt.type == "ArrayAssign":
                 array_name = stmt.array
-                index_expr = self._replace_vars_in_expr(stmt.index)
+                index_expr = self._replace_vars(stmt.index)
                 expr = self._replace_vars(stmt.expression)
                 # Increment array version
                 prev_version = self.array_versions[array_name]
-                self.array_versions[array_name] += 1
-                new_version = self.array_versions[array_name]
-                target = f"{array_name}_{new_version}"
-                self.var_stack[array_name].append(target)
-                self.instructions.append(SSAInstruction(target, f"(store {array_name}_{prev_version} {index_expr} {expr})"))
+                target = self.new_array_version(array_name)
+                self.instructions.append(SSAInstruction(target, f"(store {array_name}_{prev_version} {self._wrap(index_expr)} {self._wrap(expr)})"))
 
             elif stmt.type == "Assert":
                 cond = self._replace_vars(stmt.condition)
-                self.instructions.append(SSAInstruction("assert", cond))
+                self.instructions.append(SSAInstruction("assert", cond, self.path))
 
             elif stmt.type == "If":
                 cond = self._replace_vars(stmt.condition)
@@ -110,18 +341,23 @@ class SSAConverter:
                 before_if = copy.deepcopy(self.var_stack)
                 before_array_versions = copy.deepcopy(self.array_versions)
                 
+                self.path.append((cond_var, True))
                 self._convert_block(stmt.true_branch)
+                self.path.pop()
                 after_true = copy.deepcopy(self.var_stack)
                 after_true_arrays = copy.deepcopy(self.array_versions)
                 
                 if stmt.false_branch:
                     self.var_stack = copy.deepcopy(before_if)
                     self.array_versions = copy.deepcopy(before_array_versions)
+                    self.path.append((cond_var, False))
                     self._convert_block(stmt.false_branch)
+                    self.path.pop()
                     after_false = copy.deepcopy(self.var_stack)
                     after_false_arrays = copy.deepcopy(self.array_versions)
                     
                     modified_vars = self._collect_modified_variables(stmt.true_branch) | self._collect_modified_variables(stmt.false_branch)
+                    modified_vars -= set(self.array_versions)
                     for var in modified_vars:
                         true_ver = after_true[var][-1] if var in after_true and after_true[var] else before_if[var][-1] if var in before_if and before_if[var] else f"{var}_0"
                         false_ver = after_false[var][-1] if var in after_false and after_false[var] else before_if[var][-1] if var in before_if and before_if[var] else f"{var}_0"
@@ -133,21 +369,9 @@ class SSAConverter:
                             self.var_stack[var] = [true_ver]
                     
                     # Handle array phi nodes
-                    array_vars = set(self.array_versions.keys())
-                    for arr in array_vars:
-                        true_ver = after_true_arrays.get(arr, 0)
-                        false_ver = after_false_arrays.get(arr, 0)
-                        if true_ver != false_ver:
-                            self.array_versions[arr] = max(true_ver, false_ver) + 1
-                            new_ver = self.array_versions[arr]
-                            phi_var = f"{arr}_{new_ver}"
-                            self.var_stack[arr] = [phi_var]
-                            self.instructions.append(SSAInstruction(phi_var, f"φ({cond_var}, {arr}_{true_ver}, {arr}_{false_ver})"))
-                        else:
-                            self.array_versions[arr] = true_ver
-                            self.var_stack[arr] = [f"{arr}_{true_ver}"]
+                    self._merge_arrays(cond_var, after_true_arrays, after_false_arrays)
                 else:
-                    modified_vars = self._collect_modified_variables(stmt.true_branch)
+                    modified_vars = self._collect_modified_variables(stmt.true_branch) - set(self.array_versions)
                     for var in modified_vars:
                         var_before = before_if[var][-1] if var in before_if and before_if[var] else f"{var}_0"
                         var_true = after_true[var][-1] if var in after_true and after_true[var] else var_before
@@ -160,17 +384,14 @@ class SSAConverter:
                                 self.var_stack[var] = before_if[var]
                             else:
                                 self.var_stack[var] = [f"{var}_0"]
-                    # Restore array versions if no false branch
-                    for arr in self.array_versions:
-                        if arr not in after_true_arrays:
-                            self.array_versions[arr] = before_array_versions.get(arr, 0)
-                            self.var_stack[arr] = [f"{arr}_{self.array_versions[arr]}"]
+                    # Merge array versions with the ones from before the if
+                    self._merge_arrays(cond_var, after_true_arrays, before_array_versions)
 
             elif stmt.type == "While" and not is_loop_body:
                 before_loop = copy.deepcopy(self.var_stack)
                 before_array_versions = copy.deepcopy(self.array_versions)
                 loop_vars = self._collect_variables_in_block(stmt.body) | self._extract_variables(stmt.condition)
-                unconditional_mods = self._collect_unconditional_modifications(stmt.body)
+                unconditional_mods = self._collect_unconditional_modifications(stmt.body) - set(self.array_versions)
                 
                 phi_nodes = {}
                 for var in unconditional_mods:
@@ -200,9 +421,7 @@ class SSAConverter:
                     entry_ver = before_array_versions.get(arr, 0)
                     back_edge_ver = after_body_arrays.get(arr, entry_ver)
                     if entry_ver != back_edge_ver:
-                        self.array_versions[arr] = back_edge_ver + 1
-                        phi_var = f"{arr}_{self.array_versions[arr]}"
-                        self.var_stack[arr] = [phi_var]
+                        phi_var = self.new_array_version(arr)
                         self.instructions.append(SSAInstruction(phi_var, f"φ(while_cond, {arr}_{entry_ver}, {arr}_{back_edge_ver})"))
                     else:
                         self.array_versions[arr] = entry_ver
@@ -224,7 +443,7 @@ class SSAConverter:
                 
                 loop_vars = self._collect_variables_in_block(stmt.body) | self._extract_variables(stmt.condition) | self._extract_variables(stmt.update) | {var}
                 phi_nodes = {}
-                for loop_var in loop_vars:
+                for loop_var in loop_vars - set(self.array_versions):
                     if loop_var in self._collect_modified_variables(stmt.body) or loop_var == var:
                         entry_ver = init_var if loop_var == var else before_loop[loop_var][-1] if loop_var in before_loop and before_loop[loop_var] else f"{loop_var}_0"
                         phi_var = self.new_version(loop_var)
@@ -258,9 +477,7 @@ class SSAConverter:
                     entry_ver = before_array_versions.get(arr, 0)
                     back_edge_ver = after_body_arrays.get(arr, entry_ver)
                     if entry_ver != back_edge_ver:
-                        self.array_versions[arr] = back_edge_ver + 1
-                        phi_var = f"{arr}_{self.array_versions[arr]}"
-                        self.var_stack[arr] = [phi_var]
+                        phi_var = self.new_array_version(arr)
                         self.instructions.append(SSAInstruction(phi_var, f"φ(for_cond, {arr}_{entry_ver}, {arr}_{back_edge_ver})"))
                     else:
                         self.array_versions[arr] = entry_ver
@@ -270,6 +487,18 @@ class SSAConverter:
                     if loop_var not in phi_nodes:
                         self.var_stack[loop_var] = before_loop[loop_var] if loop_var in before_loop and before_loop[loop_var] else [f"{loop_var}_0"]
 
+    def _merge_arrays(self, cond_var, true_versions, false_versions):
+        """Emit array phi nodes after a branch whose sides left arrays at different versions."""
+        for arr in set(true_versions) | set(false_versions):
+            true_ver = true_versions.get(arr, 0)
+            false_ver = false_versions.get(arr, 0)
+            if true_ver != false_ver:
+                phi_var = self.new_array_version(arr)
+                self.instructions.append(SSAInstruction(phi_var, f"φ({cond_var}, {arr}_{true_ver}, {arr}_{false_ver})"))
+            else:
+                self.array_versions[arr] = true_ver
+                self.var_stack[arr] = [f"{arr}_{true_ver}"]
+
     def _convert_with_unrolling(self, ast, unroll_depth):
         for stmt in ast.statements:
             if stmt.type not in ["While", "For"]:
@@ -292,11 +521,16 @@ class SSAConverter:
                         self.var_stack[var].append(f"{var}_0")
                         self.seen_vars.add(var)
                 
-                # Unroll the loop
-                for _ in range(unroll_depth):
+                # Unroll the loop; each iteration only takes effect while the condition holds
+                iteration_vars = self._collect_modified_variables(stmt.body) | ({init_parts[0].strip()} if stmt.type == "For" else set())
+                for _ in range(self.loop_depths.get(id(stmt), unroll_depth)):
+                    self._checkpoint()
                     cond = self._replace_vars(stmt.condition)
                     cond_var = self.new_cond_var()
                     self.instructions.append(SSAInstruction(cond_var, cond))
+                    before_iteration = copy.deepcopy(self.var_stack)
+                    before_iteration_arrays = copy.deepcopy(self.array_versions)
+                    self.path.append((cond_var, True))
                     if any(s.type in ["While", "For"] for s in stmt.body.statements):
                         for body_stmt in stmt.body.statements:
                             if body_stmt.type in ["While", "For"]:
@@ -311,6 +545,16 @@ class SSAConverter:
                         update_expr = self._replace_vars(update_parts[1].strip())
                         update_var_new = self.new_version(update_var)
                         self.instructions.append(SSAInstruction(update_var_new, update_expr))
+                    self.path.pop()
+                    after_iteration_arrays = copy.deepcopy(self.array_versions)
+                    for var in sorted(iteration_vars - set(after_iteration_arrays) - set(before_iteration_arrays)):
+                        var_before = before_iteration[var][-1] if before_iteration.get(var) else f"{var}_0"
+                        var_after = self.var_stack[var][-1] if self.var_stack[var] else var_before
+                        if var_after != var_before:
+                            phi_var = self.new_version(var)
+                            self.instructions.append(SSAInstruction(phi_var, f"φ({cond_var}, {var_after}, {var_before})"))
+                            self.var_stack[var] = [phi_var]
+                    self._merge_arrays(cond_var, after_iteration_arrays, before_iteration_arrays)
                 
                 after_loop = copy.deepcopy(self.var_stack)
                 after_loop_arrays = copy.deepcopy(self.array_versions)
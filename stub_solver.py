@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Deterministic stand-in for the z3 binary, for load tests on machines without
+Z3. It accepts the same command line (-in, -T:<seconds>, -memory:<MB>, other
+options ignored), reads an SMT-LIB script from stdin, waits a configurable
+time and answers every check-sat the same way:
+
+    FM_STUB_ANSWER               unsat (default), sat, unknown, or hash to pick
+                                 sat/unsat from a hash of the script
+    FM_STUB_LATENCY              seconds per run (default 0.05)
+    FM_STUB_LATENCY_PER_ASSERT   extra seconds per assert (default 0)
+
+Use it with FM_Z3_PATH=/path/to/stub_solver.py.
+"""
+import hashlib
+import os
+import re
+import sys
+import time
+
+
+def commands(script):
+    """Split a script into its top-level commands."""
+    depth = 0
+    start = None
+    for i, char in enumerate(script):
+        if char == "(":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif char == ")" and depth:
+            depth -= 1
+            if depth == 0:
+                yield script[start:i + 1]
+
+
+def default_value(sort):
+    return "false" if sort == "Bool" else "0" if sort == "Int" else f"((as const {sort}) 0)"
+
+
+def main(argv):
+    timeout = None
+    for arg in argv:
+        if arg.startswith("-T:"):
+            timeout = float(arg[3:])
+    script = sys.stdin.read()
+    answer = os.environ.get("FM_STUB_ANSWER", "unsat")
+    if answer == "hash":
+        answer = "sat" if hashlib.sha1(script.encode("utf-8")).digest()[0] % 2 else "unsat"
+    latency = float(os.environ.get("FM_STUB_LATENCY", 0.05))
+    latency += float(os.environ.get("FM_STUB_LATENCY_PER_ASSERT", 0)) * script.count("(assert ")
+    if timeout is not None and latency > timeout:
+        time.sleep(timeout)
+        print("timeout")
+        return 0
+    time.sleep(latency)
+
+    declared = {}
+    output = []
+    for command in commands(script):
+        match = re.match(r'\(declare-(?:fun|const) (\S+) (?:\(\) )?(.+)\)$', command, re.DOTALL)
+        if match:
+            declared[match.group(1)] = match.group(2).strip()
+        elif command.startswith("(check-sat"):
+            output.append(answer)
+        elif command.startswith("(get-model") and answer == "sat":
+            output.append("(")
+            output.extend(f"  (define-fun {name} () {sort}\n    {default_value(sort)})" for name, sort in declared.items())
+            output.append(")")
+        elif command.startswith("(get-value") and answer == "sat":
+            terms = re.findall(r'[^\s()]+', command[len("(get-value"):])
+            output.append("(" + "\n ".join(f"({term} {default_value(declared.get(term, 'Int'))})" for term in terms) + ")")
+        elif command.startswith(("(get-model", "(get-value")):
+            output.append('(error "model is not available")')
+    print("\n".join(output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
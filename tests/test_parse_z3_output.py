@@ -0,0 +1,33 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app import parse_z3_output
+
+
+class ParseZ3OutputTest(unittest.TestCase):
+    def test_sat_keeps_the_model(self):
+        output = "sat\n(\n  (define-fun x_1 () Int\n    1)\n  (define-fun y_0 () Int\n    (- 3))\n  (define-fun cond_1 () Bool\n    true)\n)\n"
+        status, model = parse_z3_output(output)
+        self.assertEqual(status, "sat")
+        self.assertEqual(model, ["x_1 = 1", "y_0 = -3", "cond_1 = True"])
+
+    def test_sat_without_model(self):
+        self.assertEqual(parse_z3_output("sat\n"), ("sat", ["No model available due to errors."]))
+
+    def test_unsat(self):
+        status, model = parse_z3_output("unsat\n(error \"line 9 column 10: model is not available\")\n")
+        self.assertEqual(status, "unsat")
+        self.assertEqual(model, ["No counterexamples found (program is correct)."])
+
+    def test_unknown_shows_the_output(self):
+        self.assertEqual(parse_z3_output("unknown\n"), ("unknown", ["unknown"]))
+
+    def test_empty_output_is_an_error(self):
+        self.assertEqual(parse_z3_output(""), ("error", ["Verification inconclusive due to errors."]))
+
+
+if __name__ == "__main__":
+    unittest.main()